@@ -0,0 +1,224 @@
+import math
+import time
+import engine
+
+# Any-angle paths: a rover doesn't have to follow grid moves, it can drive straight from one waypoint to the next.
+# A straight segment is allowed if every node on its line is free and none of its diagonal steps cut a corner,
+# the same rule grid moves follow. It costs its length plus the extra cost of every node it enters, so a segment
+# over weighted terrain is only taken when it's actually cheaper than going around.
+#
+# find_path runs Theta*: A* where a node can take its parent's parent as its own parent when the straight segment
+# between them is allowed and no more expensive, so the path it finds is already a list of waypoints. Every such
+# check walks the segment's line, so it's several times slower than A* on large maps.
+# smooth_path instead shortens an existing grid path afterwards by pulling it straight wherever it can.
+
+def line_cells(start_pos, end_pos):
+    # Nodes on the Bresenham line from start_pos to end_pos, both included
+    x, y = start_pos
+    end_x, end_y = end_pos
+    dx = abs(end_x - x)
+    dy = abs(end_y - y)
+    step_x = 1 if end_x > x else -1
+    step_y = 1 if end_y > y else -1
+    error = dx - dy
+    cells = [(x, y)]
+    while x != end_x or y != end_y:
+        double_error = 2 * error
+        if double_error > -dy:
+            error -= dy
+            x += step_x
+        if double_error < dx:
+            error += dx
+            y += step_y
+        cells.append((x, y))
+    return cells
+
+def path_cells(waypoints):
+    # Every node along a path of waypoints, as a path of neighboring nodes
+    if not waypoints:
+        return []
+    cells = [tuple(waypoints[0])]
+    for start_pos, end_pos in zip(waypoints, waypoints[1:]):
+        cells += line_cells(start_pos, end_pos)[1:]
+    return cells
+
+def segment_cost(grid, start_pos, end_pos):
+    # Cost of driving straight from start_pos to end_pos, or inf if the line is blocked.
+    # Walks the same line as line_cells, without building it, since searches check a great many segments.
+    cells = grid.cells
+    barrier = grid.barrier
+    height = grid.height
+    x, y = start_pos
+    end_x, end_y = end_pos
+    dx = abs(end_x - x)
+    dy = abs(end_y - y)
+    step_x = height if end_x > x else -height
+    step_y = 1 if end_y > y else -1
+    error = dx - dy
+    index = x * height + y
+    end = end_x * height + end_y
+    extra = 0
+    while index != end:
+        double_error = 2 * error
+        if double_error > -dy:
+            error -= dy
+            if double_error < dx:
+                # Diagonal step, which can't cut a corner
+                error += dx
+                if cells[index + step_x] == barrier or cells[index + step_y] == barrier:
+                    return math.inf
+                index += step_x + step_y
+            else:
+                index += step_x
+        else:
+            error += dx
+            index += step_y
+        cost = cells[index]
+        if cost == barrier:
+            return math.inf
+        extra += cost
+    return math.hypot(dx, dy) + extra
+
+def path_costs(grid, path):
+    # Cost from the start of a path of neighboring nodes to each of its nodes
+    cells = grid.cells
+    height = grid.height
+    costs = [0]
+    for (x1, y1), (x2, y2) in zip(path, path[1:]):
+        move = engine.SQRT2 if x1 != x2 and y1 != y2 else 1
+        costs.append(costs[-1] + move + cells[x2 * height + y2])
+    return costs
+
+def smooth_path(grid, path):
+    # Shortens a path of neighboring nodes into waypoints. From each waypoint, the path is followed for as long as
+    # the straight segment to the next node is allowed and costs no more than following the path there.
+    # Returns (waypoints, cost); the cost is never above the cost of the original path.
+    if len(path) < 3:
+        return list(path), path_costs(grid, path)[-1] if path else math.inf
+    along = path_costs(grid, path)
+    waypoints = [path[0]]
+    cost = 0
+    i = 0
+    while i < len(path) - 1:
+        best = i + 1
+        best_cost = along[best] - along[i]
+        for j in range(i + 2, len(path)):
+            segment = segment_cost(grid, path[i], path[j])
+            if segment > along[j] - along[i] + 1e-9: # Straight runs of the path cost the same either way
+                break
+            best = j
+            best_cost = segment
+        waypoints.append(path[best])
+        cost += best_cost
+        i = best
+    return waypoints, cost
+
+def smooth_result(grid, result):
+    # The same search result with its path smoothed into waypoints. Paths that already are waypoints (Theta*)
+    # are filled in first, and kept as they are if smoothing can't make them any cheaper.
+    if not result.found:
+        return result
+    start_time = time.time()
+    waypoints, cost = smooth_path(grid, path_cells(result.path))
+    if cost >= result.cost:
+        return result
+    return engine.SearchResult(waypoints, cost, result.nodes_explored, result.elapsed + time.time() - start_time,
+        result.bound, result.stats, result.cached)
+
+def find_path(grid, start_pos, goal_pos, visit=None):
+    # Theta*. Same contract as engine.find_path, but the path holds waypoints rather than neighboring nodes.
+    # The heuristic is always euclidean, since it's the only one that never overestimates a straight segment.
+    start_time = time.time()
+    stats = engine.SearchStats()
+    if grid.components and not grid.components.connected(start_pos, goal_pos):
+        stats.end_phase("setup")
+        return engine.SearchResult([], math.inf, 0, time.time() - start_time, stats=stats)
+    height = grid.height
+    cells = grid.cells
+    start = grid.index(start_pos)
+    goal = grid.index(goal_pos)
+    goal_x, goal_y = goal_pos
+    workspace = engine.get_workspace(grid)
+    generation = workspace.next_generation()
+    stamp = workspace.stamp
+    g_score = workspace.g_score
+    h_score = workspace.h_score
+    came_from = workspace.came_from
+    nodes_explored = 0
+
+    open_list = engine.HeapQueue()
+    stamp[start] = generation
+    g_score[start] = 0
+    h_score[start] = math.hypot(start_pos[0] - goal_x, start_pos[1] - goal_y)
+    came_from[start] = start
+    open_list.push(h_score[start], 0, start)
+    stats.end_phase("setup")
+
+    closed = generation + 1 # Stamp of expanded nodes, so reopens can be counted
+    heuristic_evaluations = 1
+    pushes = 1
+    reopens = 0
+    peak_open = 0
+    path = []
+    cost = math.inf
+    while open_list:
+        if len(open_list) > peak_open:
+            peak_open = len(open_list)
+        current_g, current = open_list.pop()
+        if current_g > g_score[current]:
+            continue
+        stamp[current] = closed
+        nodes_explored += 1
+
+        if current == goal:
+            stats.end_phase("search")
+            path = engine.reconstruct_path(grid, came_from, start, goal)
+            cost = current_g
+            break
+
+        parent = came_from[current]
+        parent_pos = parent_x, parent_y = divmod(parent, height)
+        parent_g = g_score[parent]
+        for neighbor, move_cost in engine.get_neighbors(grid, current, True):
+            neighbor_x, neighbor_y = divmod(neighbor, height)
+            temp_g_score = current_g + move_cost
+            temp_parent = current
+            if parent != current:
+                # A segment costs at least its length plus the extra cost of the node it ends on, so its line is
+                # only walked when that could beat both the grid move and the neighbor's current score
+                bound = parent_g + math.hypot(neighbor_x - parent_x, neighbor_y - parent_y) + cells[neighbor]
+                if bound <= temp_g_score and (stamp[neighbor] < generation or bound < g_score[neighbor]):
+                    direct_g_score = parent_g + segment_cost(grid, parent_pos, (neighbor_x, neighbor_y))
+                    if direct_g_score <= temp_g_score:
+                        temp_g_score = direct_g_score
+                        temp_parent = parent
+            neighbor_stamp = stamp[neighbor]
+            if neighbor_stamp < generation:
+                stamp[neighbor] = generation
+                heuristic_evaluations += 1
+                h_neighbor = h_score[neighbor] = math.hypot(neighbor_x - goal_x, neighbor_y - goal_y)
+            elif temp_g_score < g_score[neighbor]:
+                if neighbor_stamp == closed:
+                    stamp[neighbor] = generation
+                    reopens += 1
+                h_neighbor = h_score[neighbor]
+            else:
+                continue
+
+            came_from[neighbor] = temp_parent
+            g_score[neighbor] = temp_g_score
+            pushes += 1
+            open_list.push(temp_g_score + h_neighbor, temp_g_score, neighbor)
+            if visit:
+                visit("open", (neighbor_x, neighbor_y))
+
+        if visit:
+            visit("closed", grid.pos(current))
+
+    stats.end_phase("reconstruction" if path else "search")
+    stats.expansions = nodes_explored
+    stats.pushes = pushes
+    stats.reopens = reopens
+    stats.peak_open = peak_open
+    stats.heuristic_evaluations = heuristic_evaluations
+    return engine.SearchResult(path, cost, nodes_explored, time.time() - start_time, stats=stats)
@@ -1,30 +1,90 @@
 import pygame
 import argparse
-import math
 import time
 import colors
 import os
-from PIL import Image
-from queue import PriorityQueue
-from collections import deque
+import engine
+import terrain
+import tour
+import hpa
+import dstar
+import pathcache
+import anyangle
+import tiles
+import numpy as np
 
 WIDTH = 1000
-WIN = pygame.display.set_mode((WIDTH, WIDTH))
-MAPS_DIR = "maps"
-pygame.display.set_caption("A* Pathfinding Algorithm")
-pygame.init()
+MAPS_DIR = engine.MAPS_DIR
+FULL_REDRAW_NODES = 1000 # Redrawing everything costs about as much as filling in this many changed nodes
+FONT = None # Created on first use; creating a font is slow enough to matter if done every frame
+
+class Canvas:
+    # Colors of every node as one array indexed [row, col], plus the nodes whose color changed since the
+    # last frame. A full redraw scales the whole array onto the window in one blit; otherwise only the
+    # changed nodes are filled in, and only their rectangles are sent to the display.
+    # Grids that aren't square have cols nodes down each column; the longer side fills the window.
+    def __init__(self, rows, width, cols=None):
+        self.rows = rows
+        self.cols = cols or rows
+        self.width = width
+        self.gap = width // max(rows, self.cols)
+        self.colors = np.full((rows, self.cols, 3), 255, dtype=np.uint8)
+        self.changed = {} # (row, col): color, written into colors when the next frame is drawn
+        self.full = True # Everything needs drawing, not just the changed nodes
+        self.scene = None # Nodes and gridlines as last drawn, for restoring what the coordinate text covered
+        self.gridlines = None
+        self.text_rect = None # Where the coordinate text was drawn last frame
+
+    def paint(self, row, col, color):
+        self.changed[row, col] = color
+
+    def make_gridlines(self):
+        # Drawn once onto a transparent surface, one line per row and one per column
+        gridlines = pygame.Surface((self.width, self.width), pygame.SRCALPHA)
+        for i in range(self.cols):
+            pygame.draw.line(gridlines, colors.GREY, (0, i * self.gap), (self.rows * self.gap, i * self.gap))
+        for i in range(self.rows):
+            pygame.draw.line(gridlines, colors.GREY, (i * self.gap, 0), (i * self.gap, self.cols * self.gap))
+        return gridlines
+
+    def render(self):
+        # Brings the scene up to date and returns the rectangles that changed, or None if all of it did
+        changed = self.changed
+        self.changed = {}
+        if changed:
+            cells = np.array(list(changed), dtype=np.intp)
+            self.colors[cells[:, 0], cells[:, 1]] = np.array(list(changed.values()), dtype=np.uint8)
+        if self.scene is None:
+            self.scene = pygame.Surface((self.width, self.width))
+            self.gridlines = self.make_gridlines()
+            self.full = True
+        if self.full or len(changed) > FULL_REDRAW_NODES:
+            size = (self.rows * self.gap, self.cols * self.gap)
+            self.scene.fill(colors.WHITE)
+            self.scene.blit(pygame.transform.scale(pygame.surfarray.make_surface(self.colors), size), (0, 0))
+            self.scene.blit(self.gridlines, (0, 0))
+            self.full = False
+            return None
+        # Gridlines run along the first row and column of pixels of every node, so filling the rest of the
+        # node leaves them untouched
+        gap = self.gap
+        rects = [pygame.Rect(row * gap + 1, col * gap + 1, gap - 1, gap - 1) for row, col in changed] if gap > 1 else []
+        for rect, color in zip(rects, changed.values()):
+            self.scene.fill(color, rect)
+        return rects
 
 class Node:
-    def __init__(self, row, col, width, total_rows):
+    def __init__(self, row, col, width, total_rows, canvas=None):
         self.row = row
         self.col = col
         self.width = width
         self.total_rows = total_rows
         self.x = row * width
         self.y = col * width
+        self.canvas = canvas
         self.color = colors.WHITE
-        self.neighbors = []
         self.extra_cost = 0
+        self.terrain_color = colors.WHITE # Color of the node's terrain, shown again once the search is cleared
         self.prev_color = self.color
         self.node_type = "untraversed"
         
@@ -64,6 +124,7 @@ class Node:
     def reset(self):
         self.color = colors.WHITE
         self.extra_cost = 0
+        self.terrain_color = colors.WHITE
         self.node_type = "untraversed"
 
     def set_closed(self):
@@ -78,25 +139,23 @@ class Node:
         self.color = colors.BLACK
         self.node_type = "barrier"
 
-    def set_fivesplit1(self):
-        self.color = colors.FIVESPLIT_1
-        self.extra_cost = 1
+    def set_weighted(self, extra_cost, color):
+        self.color = color
+        self.extra_cost = extra_cost
+        self.terrain_color = color
         self.node_type = "untraversed"
+
+    def set_fivesplit1(self):
+        self.set_weighted(1, colors.FIVESPLIT_1)
     
     def set_fivesplit2(self):
-        self.color = colors.FIVESPLIT_2
-        self.extra_cost = 2
-        self.node_type = "untraversed"
+        self.set_weighted(2, colors.FIVESPLIT_2)
 
     def set_fivesplit3(self):
-        self.color = colors.FIVESPLIT_3
-        self.extra_cost = 3
-        self.node_type = "untraversed"
+        self.set_weighted(3, colors.FIVESPLIT_3)
 
     def set_fivesplit4(self):
-        self.color = colors.FIVESPLIT_4
-        self.extra_cost = 4
-        self.node_type = "untraversed"
+        self.set_weighted(4, colors.FIVESPLIT_4)
 
     def set_start(self):
         self.color = colors.ORANGE
@@ -110,77 +169,42 @@ class Node:
         self.color = colors.PURPLE
         self.node_type = "path"
 
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, color):
+        # Every color change is passed on to the canvas, which redraws only what changed
+        self._color = color
+        if self.canvas:
+            self.canvas.paint(self.row, self.col, color)
+
     def draw(self, win):
         pygame.draw.rect(win, self.color, (self.x, self.y, self.width, self.width))
 
-    def update_neighbors(self, grid, heuristic):
-        self.neighbors = []
-        if heuristic == "manhattan":
-            directions = [
-                (1, 0), (-1, 0), (0, 1), (0, -1)  # Cardinal directions only
-            ]
-        else:
-            directions = [
-                (1, 0), (-1, 0), (0, 1), (0, -1),  # Cardinal directions
-                (1, 1), (1, -1), (-1, 1), (-1, -1)  # Diagonal directions
-            ]
-        for drow, dcol in directions:
-            new_row, new_col = self.row + drow, self.col + dcol
-            if 0 <= new_row < self.total_rows and 0 <= new_col < self.total_rows:
-                if abs(drow) + abs(dcol) == 2:  # Diagonal movement
-                    if not grid[new_row][new_col].is_barrier() and not (grid[self.row][new_col].is_barrier() or grid[new_row][self.col].is_barrier()):
-                        self.neighbors.append(grid[new_row][new_col])
-                else:
-                    if not grid[new_row][new_col].is_barrier():
-                        self.neighbors.append(grid[new_row][new_col])
-
     def __lt__(self, other):
         return False
     
-def h(n1, n2, heuristic):
-    x1, y1 = n1
-    x2, y2 = n2
-    dx, dy = abs(x1 - x2), abs(y1 - y2)
-
-    if heuristic.lower() == "manhattan":
-        return dx + dy
-    elif heuristic.lower() == "euclidean":
-        return math.sqrt(dx ** 2 + dy ** 2)
-    elif heuristic.lower() == "octile":
-        return max(dx, dy) + (math.sqrt(2) - 1) * min(dx, dy)
-
-def reconstruct_path(came_from, current, draw, start_pos):
-    while current in came_from:
-        if came_from[current] == start_pos:
-            break  # Stop before setting the start node as path
-        current = came_from[current]
-        current.set_path()
+def reconstruct_path(grid, path, draw):
+    # Colors the nodes along a path, filling in the segments between the waypoints of any-angle and smoothed paths
+    for row, col in anyangle.path_cells(path)[1:-1]: # Leave the start and end nodes colored as they are
+        grid[row][col].set_path()
         draw()
 
-def bfs_precheck(start, end):
-    bfs_start_time = time.time()    
-    visited = set()
-    queue = deque([start])
-    
-    is_reachable = False
-    while queue:
-        current = queue.popleft()
-        if current == end:
-            is_reachable = True
-            break
-        for neighbor in current.neighbors:
-            if not neighbor.is_barrier() and neighbor not in visited:
-                visited.add(neighbor)
-                queue.append(neighbor)
-
-    bfs_end_time = time.time()
-    bfs_elapsed_time = bfs_end_time - bfs_start_time
+def precheck(cost_grid, start, end):
+    # The first check labels the grid's connected components (or loads them from the map cache);
+    # after that, edits keep the labels up to date and every check is a label comparison
+    precheck_start_time = time.time()
+    is_reachable = engine.is_reachable(cost_grid, start.get_pos(), end.get_pos())
+    precheck_end_time = time.time()
+    precheck_elapsed_time = precheck_end_time - precheck_start_time
     if not is_reachable:
-        print(f"\nEnd node [{end.row}, {end.col}] is unreachable from start node [{start.row}, {start.col}].")   
-        print(f"BFS pre-check took {bfs_elapsed_time:.4f} seconds to confirm.")
+        print(f"\nEnd node [{end.row}, {end.col}] is unreachable from start node [{start.row}, {start.col}].")
+        print(f"Reachability pre-check took {precheck_elapsed_time:.4f} seconds to confirm.")
         quit()
-    print(f"\nA path exists from start node [{start.row}, {start.col}] to end node [{end.row}, {end.col}].")   
-    print(f"BFS pre-check took {bfs_elapsed_time:.4f} seconds to confirm.")
+    print(f"\nA path exists from start node [{start.row}, {start.col}] to end node [{end.row}, {end.col}].")
+    print(f"Reachability pre-check took {precheck_elapsed_time:.4f} seconds to confirm.")
 
 def toggle_search_area(grid):
         for row in grid:
@@ -188,170 +212,219 @@ def toggle_search_area(grid):
                 if node.node_type == "traversed":
                     if node.color == colors.GREEN or node.color == colors.RED:
                         node.prev_color = node.color
-                        if node.extra_cost == 0:
-                            node.color = colors.WHITE
-                        elif node.extra_cost == 1:
-                            node.color = colors.FIVESPLIT_1
-                        elif node.extra_cost == 2:
-                            node.color = colors.FIVESPLIT_2
-                        elif node.extra_cost == 3:
-                            node.color = colors.FIVESPLIT_3
-                        elif node.extra_cost == 4:
-                            node.color = colors.FIVESPLIT_4
+                        node.color = node.terrain_color
                     else:
                         node.color = node.prev_color
 
-def algorithm(draw, grid, start_pos, end_pos, heurisitc):
-    start_time = time.time() # Start timer
-    count = 0
-    nodes_explored = 0
-    open_set = PriorityQueue()
-    open_set.put((0, count, start_pos)) # Start with the start node in the open set
-    came_from = {}
-    g_score = {node: float("inf") for row in grid for node in row} # Keeps track of the current shortest distance from start node to this node
-    g_score[start_pos] = 0
-    f_score = {node: float("inf") for row in grid for node in row} # Keeps track of the predicted distance from this node to the end node
-    f_score[start_pos] = h(start_pos.get_pos(), end_pos.get_pos(), heurisitc)
-
-    open_set_hash = {start_pos}
-
-    while not open_set.empty():
+def clear_search(grid):
+    # Recolors searched and path nodes back to their terrain, leaving the start and end nodes as they are
+    for row in grid:
+        for node in row:
+            if node.node_type == "traversed" or node.is_path():
+                if node.extra_cost:
+                    node.set_weighted(node.extra_cost, node.terrain_color)
+                else:
+                    node.reset()
+
+def skip_frames(draw, frame_skip):
+    # Only every frame_skip-th call actually draws (and checks for window events)
+    calls = 0
+    def draw_some():
+        nonlocal calls
+        calls += 1
+        if calls % frame_skip:
+            return
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
-        
-        current = open_set.get()[2]
-        open_set_hash.remove(current)
-        nodes_explored += 1
-
-        if current == end_pos:
-            reconstruct_path(came_from, end_pos, draw, start_pos)
-            end_pos.set_end()
-            end_time = time.time()
-            print(f"\nPath successfully found.\nExecution time: {end_time - start_time:.4f} seconds\nTotal path cost: {g_score[end_pos]:.4f}\nTotal spaces explored: {nodes_explored}")
-
-            # Admissibility check: heuristic(start) should not be greater than actual cost
-            true_cost = g_score[end_pos]
-            h_start = h(start_pos.get_pos(), end_pos.get_pos(), heurisitc)
-
-            if h_start > true_cost + 1e-5:
-                print(f"NOT ADMISSIBLE! Heuristic from start ({start_pos.get_pos()}) "
-                    f"overestimates cost. h(start): {h_start:.4f}, true_cost: {true_cost:.4f}")
-            else:
-                print(f"Heuristic appears ADMISSIBLE. h(start): {h_start:.4f}, true_cost: {true_cost:.4f}")
-
-            return True
-        
-        for neighbor in current.neighbors:
-            # Determine g_score based on cardinal/diagonal
-            if heurisitc.lower() == "manhattan": 
-                move_cost = 1
-            else: 
-                move_cost = 1 if abs(neighbor.row - current.row) + abs(neighbor.col - current.col) == 1 else math.sqrt(2)
-            
-            # Make sure to add extra edge weights based on node color
-            temp_g_score = g_score[current] + move_cost + neighbor.extra_cost
-
-            # Get heuristic values
-            h_current = h(current.get_pos(), end_pos.get_pos(), heurisitc)
-            h_neighbor = h(neighbor.get_pos(), end_pos.get_pos(), heurisitc)
-
-            # Consistency check: h(current) <= move_cost + h(neighbor)
-            if h_current > move_cost + h_neighbor + 1e-5:  # Add epsilon for float precision
-                print(f"INCONSISTENT! At node {current.get_pos()} to {neighbor.get_pos()}: "
-                    f"h(current): {h_current:.4f}, move_cost: {move_cost:.4f}, "
-                    f"h(neighbor): {h_neighbor:.4f}")
-
-            if temp_g_score < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = temp_g_score
-                f_score[neighbor] = temp_g_score + h(neighbor.get_pos(), end_pos.get_pos(), heurisitc)
-
-                if neighbor not in open_set_hash:
-                    count += 1
-                    open_set.put((f_score[neighbor], count, neighbor))
-                    open_set_hash.add(neighbor)
-                    neighbor.set_open()
         draw()
+    return draw_some
+
+def algorithm(draw, grid, cost_grid, start_pos, end_pos, heuristic, audit=False, cluster_size=None, planner=None, bidirectional=False, epsilon=0, frame_skip=1, stats=False, cache=None, any_angle=False, smooth=False):
+    # Returns the search result. With draw set to None the search runs at full speed and only the final path is colored.
+    # Otherwise the window is redrawn every frame_skip expansions (and path nodes). stats prints the search stats.
+    # With a cache (pathcache.PathCache), a query already answered on the same grid isn't searched again.
+    # With a cluster_size, searches hierarchically (HPA*) with clusters of that size.
+    # With a planner (dstar.DStarLite), only repairs its previous search after the edits made since.
+    # bidirectional searches from both ends at once, and an epsilon above 0 runs weighted A*.
+    # any_angle runs Theta* instead, and smooth shortens the path found into straight segments.
+    if draw:
+        draw = skip_frames(draw, frame_skip)
+
+    def visit(kind, pos):
+        node = grid[pos[0]][pos[1]]
+        if kind == "open":
+            node.set_open()
+            return
 
-        if current != start_pos:
-            current.set_closed()
-
-    end_time = time.time()
-    print(f"\nUnable to find a path.\nExecution time: {end_time - start_time:.4f} seconds\nTotal spaces explored: {nodes_explored}")
-    return False
-
-def make_grid(rows, width):
+        draw()
+        if node != start_pos:
+            node.set_closed()
+
+    def search():
+        if any_angle:
+            return anyangle.find_path(cost_grid, start_pos.get_pos(), end_pos.get_pos(), visit if draw else None)
+        if cluster_size:
+            return hpa.find_path(cost_grid, start_pos.get_pos(), end_pos.get_pos(), heuristic, cluster_size, visit if draw else None)
+        if bidirectional:
+            return engine.find_path_bidirectional(cost_grid, start_pos.get_pos(), end_pos.get_pos(), heuristic, visit if draw else None)
+        return engine.find_path(cost_grid, start_pos.get_pos(), end_pos.get_pos(), heuristic, visit if draw else None, epsilon)
+
+    if planner:
+        result = planner.plan(visit if draw else None)
+    elif cache:
+        mode = pathcache.search_mode(cluster_size, bidirectional, epsilon, any_angle)
+        result = cache.search(cost_grid, start_pos.get_pos(), end_pos.get_pos(), heuristic, mode, search)
+        cache.save()
+    else:
+        result = search()
+    if smooth:
+        result = anyangle.smooth_result(cost_grid, result)
+    if result.found:
+        reconstruct_path(grid, result.path, draw or (lambda: None))
+        start_pos.set_start()
+        end_pos.set_end()
+    engine.print_result(result)
+    if stats:
+        engine.print_stats(result.stats)
+    if audit:
+        engine.print_audit(engine.audit_heuristic(cost_grid, end_pos.get_pos(), heuristic, anyangle.path_cells(result.path)))
+    return result
+
+def make_grid(rows, width, cols=None):
+    # All nodes of a grid share one canvas, which draws them. cols is the number of nodes down each column,
+    # if it differs from rows.
     grid = []
-    gap = width // rows
+    canvas = Canvas(rows, width, cols)
+    gap = canvas.gap
     for i in range(rows):
         grid.append([])
-        for j in range(rows):
-            node = Node(i, j, gap, rows)
+        for j in range(canvas.cols):
+            node = Node(i, j, gap, rows, canvas)
             grid[i].append(node)
     return grid
 
-def draw_gridlines(win, rows, width):
-    gap = width // rows
-    for i in range(rows):
-        pygame.draw.line(win, colors.GREY, (0, i * gap), (width, i * gap))
-        for j in range(rows):
-            pygame.draw.line(win, colors.GREY, (j * gap, 0), (j * gap, width))
+def get_font():
+    global FONT
+    if FONT is None:
+        FONT = pygame.font.SysFont(None, 24)
+    return FONT
 
 def draw(win, grid, rows, width):
-    win.fill(colors.WHITE)
-    for row in grid:
-        for node in row:
-            node.draw(win)
-
-    draw_gridlines(win, rows, width)
+    canvas = grid[0][0].canvas
+    rects = canvas.render()
+    if rects is None:
+        win.blit(canvas.scene, (0, 0))
+    else:
+        # Restore what last frame's coordinate text covered, along with the changed nodes
+        if canvas.text_rect:
+            rects.append(canvas.text_rect)
+        for rect in rects:
+            win.blit(canvas.scene, rect, rect)
+    canvas.text_rect = None
 
     # Draw coordinates of hovered node
     mouse_x, mouse_y = pygame.mouse.get_pos()
-    if 0 <= mouse_x < width and 0 <= mouse_y < width:
-        row, col = get_clicked_pos((mouse_x, mouse_y), rows, width)
+    if 0 <= mouse_x < canvas.rows * canvas.gap and 0 <= mouse_y < canvas.cols * canvas.gap:
+        row, col = get_clicked_pos((mouse_x, mouse_y), rows, width, canvas.cols)
         coord_text = f"({row}, {col})"
-        font = pygame.font.SysFont(None, 24)
-        text_surf = font.render(coord_text, True, (0, 0, 0))
+        text_surf = get_font().render(coord_text, True, (0, 0, 0))
 
         # Draw at different offset based on mouse x/y to prevent it rendering outside of the window
-        x_offset = -50 if row >= rows / 2 else 15
-        y_offset = -20 if col >= rows / 2 else 10
+        x_offset = -50 if mouse_x >= width / 2 else 15
+        y_offset = -20 if mouse_y >= width / 2 else 10
         text_rect = text_surf.get_rect(topleft=(mouse_x + x_offset, mouse_y + y_offset))
         win.blit(text_surf, text_rect)
-    
-    pygame.display.update()
+        canvas.text_rect = text_rect
+        if rects is not None:
+            rects.append(text_rect)
+
+    if rects is None:
+        pygame.display.update()
+    elif rects:
+        pygame.display.update(rects)
 
-def get_clicked_pos(pos, rows, width):
-    gap = width // rows
+def get_clicked_pos(pos, rows, width, cols=None):
+    gap = width // max(rows, cols or rows)
     y, x = pos
     row = y // gap
     col = x // gap
     return row, col
 
-def load_map(grid, map_path, map_img):
-    map_pixels = Image.open(map_path).load()
-    for y in range(map_img.height):
-        for x in range(map_img.width):
-            if map_pixels[x,y] == colors.BLACK:
-                grid[x][y].set_barrier() 
-            elif map_pixels[x,y] == colors.FIVESPLIT_4:
-                grid[x][y].set_fivesplit4()
-            elif map_pixels[x,y] == colors.FIVESPLIT_3:
-                grid[x][y].set_fivesplit3()
-            elif map_pixels[x,y] == colors.FIVESPLIT_2:
-                grid[x][y].set_fivesplit2()
-            elif map_pixels[x,y] == colors.FIVESPLIT_1:
-                grid[x][y].set_fivesplit1()
-
-def main(win, width):
+def terrain_shade(cost, max_cost):
+    # Color of a node on a map with continuous costs, from the lightest fivesplit gray for the cheapest
+    # nodes to the darkest for the most expensive one
+    light = np.array(colors.FIVESPLIT_1)
+    dark = np.array(colors.FIVESPLIT_4)
+    return tuple(int(val) for val in np.rint(light + (dark - light) * min(cost / max_cost, 1)))
+
+def load_map(grid, map_grid):
+    # Nodes are only a view of the map for drawing; only non-empty cells need touching.
+    # Maps with only the five image levels keep their colors; finer costs are shaded in between.
+    costs = map_grid.costs
+    weighted = (costs != 0) & (costs != map_grid.barrier)
+    max_cost = float(costs[weighted].max()) if weighted.any() else 0
+    fivesplit = costs.dtype == np.uint8 and max_cost <= 4
+    for x, y in zip(*np.nonzero(costs)):
+        node = grid[x][y]
+        cost = costs[x, y]
+        if cost == map_grid.barrier:
+            node.set_barrier()
+        elif not fivesplit:
+            node.set_weighted(float(cost), terrain_shade(float(cost), max_cost))
+        elif cost == 4:
+            node.set_fivesplit4()
+        elif cost == 3:
+            node.set_fivesplit3()
+        elif cost == 2:
+            node.set_fivesplit2()
+        elif cost == 1:
+            node.set_fivesplit1()
+
+def main(width):
     parser = argparse.ArgumentParser()
-    parser.add_argument("heuristic", type=str, choices=["manhattan", "euclidean", "octile"], help="Choose the heuristic function.")
+    parser.add_argument("heuristic", type=str, choices=engine.CHOICES, help="Choose the heuristic function.")
     parser.add_argument("--size", type=int, default=50, help="Grid size. Grid is square, so 'size' value will apply to height AND width of the grid.")
-    parser.add_argument("--use_map", type=str, help="Choose an image to use for a predefined map. Image dimensions required to match grid size. Overrides --size.")
-    parser.add_argument("--path_only", type=int, nargs="+", help="Enter two points in the form [X1 Y1 X2 Y2]. Will only display the final path.")
-    parser.add_argument("-p", "--precheck", action="store_true", help="Run a BFS precheck to confirm that the start node can reach the end node")
+    parser.add_argument("--height", type=int, help="Height of the grid, for a grid that isn't square. --size is then its width.")
+    parser.add_argument("--use_map", type=str, help="Choose an image to use for a predefined map. Overrides --size and --height; maps don't have to be square.")
+    parser.add_argument("--path_only", type=int, nargs="+", help="Enter two or more points in the form [X1 Y1 X2 Y2 ...]. Will only display the final path. With more than two points, shows the shortest tour through all of them starting at the first.")
+    parser.add_argument("-p", "--precheck", action="store_true", help="Check the map's connected components to confirm that the start node can reach the end node")
+    parser.add_argument("--audit", action="store_true", help="After the search, check the heuristic for consistency and admissibility and print the number of violations.")
+    parser.add_argument("--hierarchical", action="store_true", help="Use hierarchical pathfinding (HPA*). Much faster on large maps, but paths can be slightly longer than optimal.")
+    parser.add_argument("--cluster_size", type=int, default=hpa.CLUSTER_SIZE, help="Cluster width/height for --hierarchical.")
+    parser.add_argument("--incremental", action="store_true", help="Replan with D* Lite: after the first search, SPACE only repairs the parts of the search affected by edits.")
+    parser.add_argument("--bidirectional", action="store_true", help="Search from both the start and the goal at once. Paths stay optimal.")
+    parser.add_argument("--epsilon", type=float, default=0, help="Use weighted A*: explores fewer nodes, with a path cost guaranteed within (1 + epsilon) of optimal.")
+    parser.add_argument("--any_angle", action="store_true", help="Find any-angle paths with Theta*: straight segments between waypoints in any direction, instead of grid moves. Always uses the euclidean heuristic.")
+    parser.add_argument("--smooth", action="store_true", help="Shorten the path found into straight segments between waypoints wherever that costs no more.")
+    parser.add_argument("--stats", action="store_true", help="After the search, print its stats: expansions, pushes, reopens, peak open list size, heuristic evaluations and time per phase.")
+    parser.add_argument("--cache", type=int, nargs="?", const=pathcache.CACHE_SIZE, help="Reuse the results of queries already answered on the same, unchanged grid, from a cache of this many paths kept between runs (1024 without a number).")
+    parser.add_argument("--frame_skip", type=int, default=1, help="Redraw the window only every this many expanded nodes while searching. Larger values keep big maps close to headless speed.")
     args = parser.parse_args()
+    cluster_size = args.cluster_size if args.hierarchical else None
+    planner = None # D* Lite planner kept between runs with --incremental
+
+    if args.epsilon < 0:
+        print("ERR: --epsilon can't be negative.")
+        quit()
+    if args.frame_skip < 1:
+        print("ERR: --frame_skip must be at least 1.")
+        quit()
+    if args.cache is not None and args.cache < 1:
+        print("ERR: --cache must hold at least 1 path.")
+        quit()
+    if args.any_angle and (args.hierarchical or args.incremental or args.bidirectional or args.epsilon):
+        print("ERR: --any_angle can't be combined with --hierarchical, --incremental, --bidirectional or --epsilon.")
+        quit()
+    if args.epsilon and (args.hierarchical or args.incremental or args.bidirectional or args.heuristic == "jps"):
+        print("ERR: --epsilon can't be combined with --hierarchical, --incremental, --bidirectional or jps.")
+        quit()
+    cache = pathcache.open_cache(args.cache) if args.cache else None
+
+    if args.size < 1 or (args.height is not None and args.height < 1):
+        print("ERR: --size and --height must be at least 1.")
+        quit()
+    cols = args.height or args.size # Nodes down each column of the grid
 
     start_pos = None
     end_pos = None
@@ -361,45 +434,55 @@ def main(win, width):
         if not os.path.exists(map_path):
             print(f"ERR: Could not find the map image at: {args.use_map}")
             quit()
-        map_img = Image.open(map_path)
-        args.size = map_img.width
+        if tiles.is_tiled(map_path):
+            print("ERR: Tiled maps are too large to draw. Search them with engine.py instead.")
+            quit()
+        map_grid = terrain.load_grid(map_path)
+        args.size = map_grid.width
+        cols = map_grid.height
 
     if args.path_only:
-        if len(args.path_only) != 4:
-            print("ERR: Invalid number of supplied values. Supplied points for --path_only should be in form [X1 Y1 X2 Y2].")
+        if len(args.path_only) < 4 or len(args.path_only) % 2:
+            print("ERR: Invalid number of supplied values. Supplied points for --path_only should be in form [X1 Y1 X2 Y2 ...].")
             quit()
-        for coord in args.path_only:
-            if coord >= args.size or coord < 0:
+        for i, coord in enumerate(args.path_only):
+            if coord >= (cols if i % 2 else args.size) or coord < 0:
                 print("ERR: Invalid coord in --path_only. Coord value must be between 0 and the map size.")
                 quit()
 
-    grid = make_grid(args.size, width)
+    grid = make_grid(args.size, width, cols)
+    cost_grid = terrain.make_grid(args.size, cols) # What the engine searches; kept in sync with every edit to grid
 
     if args.use_map:
-        load_map(grid, map_path, map_img)
-
-    if args.path_only:
+        load_map(grid, map_grid)
+        cost_grid = map_grid.copy()
+
+    if args.path_only and len(args.path_only) > 4:
+        points = list(zip(args.path_only[::2], args.path_only[1::2]))
+        tour_plan = tour.plan_tour(cost_grid, points, args.heuristic)
+        for x, y in tour_plan.path:
+            grid[x][y].set_path()
+        for x, y in tour_plan.order:
+            grid[x][y].set_end()
+        grid[points[0][0]][points[0][1]].set_start()
+        tour.print_tour(tour_plan)
+    elif args.path_only:
         x1, y1, x2, y2 = args.path_only
         start_pos = grid[x1][y1]
         start_pos.set_start()
         end_pos = grid[x2][y2]
         end_pos.set_end()
 
-        # Update neighbors first
-        for row in grid:
-            for node in row:
-                node.update_neighbors(grid, args.heuristic)
-
         if args.precheck:
-            bfs_precheck(start_pos, end_pos)
+            precheck(cost_grid, start_pos, end_pos)
 
-        # Run algorithm with dummy draw function
-        algorithm(lambda: None, grid, start_pos, end_pos, args.heuristic)
+        # Run algorithm without drawing
+        algorithm(None, grid, cost_grid, start_pos, end_pos, args.heuristic, args.audit, cluster_size, None, args.bidirectional, args.epsilon, stats=args.stats, cache=cache, any_angle=args.any_angle, smooth=args.smooth)
 
-        # Now show window and draw final state
-        global WIN
-        WIN = pygame.display.set_mode((width, width))
-        draw(WIN, grid, args.size, width)
+    # Only open the window once the (possibly headless) search above is done
+    pygame.init()
+    WIN = pygame.display.set_mode((width, width))
+    pygame.display.set_caption("A* Pathfinding Algorithm")
 
     run = True
     while run:
@@ -408,9 +491,11 @@ def main(win, width):
             if event.type == pygame.QUIT:
                 run = False
 
-            if pygame.mouse.get_pressed()[0]:
-                pos = pygame.mouse.get_pos()
-                row, col = get_clicked_pos(pos, args.size, width)
+            # Windows of grids that aren't square have room to spare beside the grid
+            row, col = get_clicked_pos(pygame.mouse.get_pos(), args.size, width, cols)
+            on_grid = row < args.size and col < cols
+
+            if pygame.mouse.get_pressed()[0] and on_grid:
                 node = grid[row][col]
                 if not start_pos and node != end_pos:
                     start_pos = node
@@ -420,12 +505,12 @@ def main(win, width):
                     end_pos.set_end()
                 elif node != start_pos and node != end_pos:
                     node.set_barrier()
+                    cost_grid.set_barrier(node.get_pos())
 
-            elif pygame.mouse.get_pressed()[2]:
-                pos = pygame.mouse.get_pos()
-                row, col = get_clicked_pos(pos, args.size, width)
+            elif pygame.mouse.get_pressed()[2] and on_grid:
                 node = grid[row][col]
                 node.reset()
+                cost_grid.reset(node.get_pos())
                 if node == start_pos:
                     start_pos = None
                 if node == end_pos:
@@ -433,31 +518,39 @@ def main(win, width):
 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE and start_pos and end_pos:
-                    # Update neighbors for each node
-                    for row in grid:
-                        for node in row:
-                            node.update_neighbors(grid, args.heuristic)
-
                     if args.precheck:
-                        # Quick BFS check if the end node is reachable from the start node
-                        bfs_precheck(start_pos, end_pos)
+                        # Quick check if the end node is reachable from the start node
+                        precheck(cost_grid, start_pos, end_pos)
+
+                    if args.incremental:
+                        # Start over only if the start, end or whole grid changed; edits to cells are followed by the planner
+                        start_index = cost_grid.index(start_pos.get_pos())
+                        end_index = cost_grid.index(end_pos.get_pos())
+                        if not planner or planner.grid is not cost_grid or planner.start != start_index or planner.goal != end_index:
+                            if planner:
+                                planner.close()
+                            planner = dstar.DStarLite(cost_grid, start_pos.get_pos(), end_pos.get_pos(), args.heuristic)
+                        clear_search(grid)
 
-                    algorithm(lambda: draw(WIN, grid, args.size, width), grid, start_pos, end_pos, args.heuristic)
+                    algorithm(lambda: draw(WIN, grid, args.size, width), grid, cost_grid, start_pos, end_pos, args.heuristic, args.audit, cluster_size, planner, args.bidirectional, args.epsilon, args.frame_skip, args.stats, cache, args.any_angle, args.smooth)
 
                 if event.key == pygame.K_c:
                     start_pos = None
                     end_pos = None
-                    grid = make_grid(args.size, width)
+                    grid = make_grid(args.size, width, cols)
+                    cost_grid = terrain.make_grid(args.size, cols)
 
                 if event.key == pygame.K_r:
                     start_pos = None
                     end_pos = None
-                    grid = make_grid(args.size, width)
-                    load_map(grid, map_path, map_img)
+                    grid = make_grid(args.size, width, cols)
+                    load_map(grid, map_grid)
+                    cost_grid = map_grid.copy()
 
                 if event.key == pygame.K_t:
                     toggle_search_area(grid)
 
     pygame.quit()
 
-main(WIN, WIDTH)
\ No newline at end of file
+if __name__ == "__main__":
+    main(WIDTH)
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import engine
+import landmarks
+import terrain
+from multiprocessing import Pool, shared_memory
+
+# Set up in each worker process by init_worker
+worker_grid = None
+worker_heuristic = None
+worker_memory = None
+worker_include_path = False
+
+def init_worker(memory_name, shape, dtype, source_path, source_hash, heuristic, include_path):
+    # Map the shared cost array instead of decoding the map again in every worker. The map's source is set too,
+    # so workers load derived data such as the ALT tables from the cache instead of each building it again.
+    global worker_grid, worker_heuristic, worker_memory, worker_include_path
+    worker_memory = shared_memory.SharedMemory(name=memory_name)
+    worker_grid = terrain.Grid(np.ndarray(shape, dtype=dtype, buffer=worker_memory.buf))
+    worker_grid.source_path = source_path
+    worker_grid.source_hash = source_hash
+    worker_heuristic = heuristic
+    worker_include_path = include_path
+
+def run_query(job):
+    index, start, goal = job
+    result = engine.find_path(worker_grid, start, goal, worker_heuristic)
+    return index, start, goal, result.cost, result.nodes_explored, result.elapsed, result.path if worker_include_path else None
+
+def run_batch(grid, queries, heuristic, workers=None, chunk_size=16, include_path=False):
+    # Yields (query index, start, goal, cost, nodes explored, seconds, path or None) in the order queries finish.
+    # The grid's cost array is copied once into shared memory, which every worker process maps.
+    if heuristic == "alt":
+        landmarks.get_tables(grid) # Built (and saved) once here, then loaded by every worker
+    memory = shared_memory.SharedMemory(create=True, size=max(grid.costs.nbytes, 1))
+    try:
+        np.ndarray(grid.costs.shape, dtype=grid.costs.dtype, buffer=memory.buf)[:] = grid.costs
+        jobs = [(index, start, goal) for index, (start, goal) in enumerate(queries)]
+        source_path, source_hash = (grid.source_path, grid.source_hash) if not grid.revision else (None, None)
+        initargs = (memory.name, grid.costs.shape, grid.costs.dtype.str, source_path, source_hash, heuristic, include_path)
+        with Pool(workers, initializer=init_worker, initargs=initargs) as pool:
+            for row in pool.imap_unordered(run_query, jobs, chunk_size):
+                yield row
+    finally:
+        memory.close()
+        memory.unlink()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a file of queries against one map in parallel across all cores. Streams one JSON line per finished query.")
+    parser.add_argument("heuristic", type=str, choices=engine.CHOICES, help="Choose the heuristic function.")
+    parser.add_argument("queries", type=str, help="File of queries, one per line in the form X1 Y1 X2 Y2.")
+    parser.add_argument("--size", type=int, default=50, help="Grid size. Grid is square, so 'size' value will apply to height AND width of the grid.")
+    parser.add_argument("--use_map", type=str, help="Choose an image to use for a predefined map. Overrides --size.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes. Defaults to the number of cores.")
+    parser.add_argument("--chunk_size", type=int, default=16, help="Queries handed to a worker at a time.")
+    parser.add_argument("--include_path", action="store_true", help="Include the full path of every query in the output.")
+    args = parser.parse_args()
+
+    if args.use_map:
+        map_path = os.path.join(engine.MAPS_DIR, args.use_map)
+        if not os.path.exists(map_path):
+            print(f"ERR: Could not find the map image at: {args.use_map}")
+            quit()
+        grid = terrain.load_grid(map_path)
+    else:
+        grid = terrain.make_grid(args.size)
+
+    queries = engine.read_queries(args.queries)
+    for start, goal in queries:
+        if not grid.in_bounds(start) or not grid.in_bounds(goal):
+            print("ERR: Invalid coord in query. Coord value must be between 0 and the map size.")
+            quit()
+
+    batch_start_time = time.time()
+    for index, start, goal, cost, nodes_explored, elapsed, path in run_batch(grid, queries, args.heuristic, args.workers, args.chunk_size, args.include_path):
+        row = {
+            "query": index,
+            "start": list(start),
+            "goal": list(goal),
+            "cost": cost if cost != float("inf") else None, # JSON has no infinity; null means unreachable
+            "nodes_explored": nodes_explored,
+            "elapsed": elapsed,
+        }
+        if path is not None:
+            row["path"] = [list(pos) for pos in path]
+        print(json.dumps(row), flush=True)
+    print(f"# {len(queries)} queries in {time.time() - batch_start_time:.4f} seconds", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
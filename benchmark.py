@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+import engine
+import terrain
+from PIL import Image
+
+# Split points used for synthetic fivesplit fields, same as the README example
+FIVESPLIT_POINTS = [50, 80, 100, 150, 200]
+SLOPE_LIMIT = 1 # Steepest traversable slope of synthetic slope fields, in height per node
+
+def random_obstacles(size, seed, density=0.25):
+    rng = np.random.default_rng(seed)
+    costs = np.zeros((size, size), dtype=np.uint8)
+    costs[rng.random((size, size)) < density] = terrain.BARRIER
+    return terrain.Grid(costs)
+
+def maze(size, seed):
+    # Depth-first backtracker maze. Cells sit on even coordinates and the walls between them are carved out.
+    rng = random.Random(seed)
+    costs = np.full((size, size), terrain.BARRIER, dtype=np.uint8)
+    cells = (size + 1) // 2
+    visited = bytearray(cells * cells)
+    stack = [(0, 0)]
+    visited[0] = 1
+    costs[0, 0] = 0
+    directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+    while stack:
+        cx, cy = stack[-1]
+        rng.shuffle(directions)
+        for dx, dy in directions:
+            nx, ny = cx + dx, cy + dy
+            if 0 <= nx < cells and 0 <= ny < cells and not visited[nx * cells + ny]:
+                visited[nx * cells + ny] = 1
+                costs[2 * cx + dx, 2 * cy + dy] = 0
+                costs[2 * nx, 2 * ny] = 0
+                stack.append((nx, ny))
+                break
+        else:
+            stack.pop()
+    return terrain.Grid(costs)
+
+def fivesplit_field(size, seed):
+    # Blocky value noise summed over a few octaves, then split into barrier/cost levels like img_to_grid.py --fivesplit
+    rng = np.random.default_rng(seed)
+    brightness = np.zeros((size, size))
+    for octave in range(2, 7):
+        block = max(size >> octave, 1)
+        coarse = rng.random((-(-size // block), -(-size // block)))
+        brightness += np.kron(coarse, np.ones((block, block)))[:size, :size] / octave
+    brightness = 255 * (brightness - brightness.min()) / max(np.ptp(brightness), 1e-9)
+    levels = np.digitize(brightness, FIVESPLIT_POINTS) # 0 is darkest (barrier), 5 is white (free)
+    lookup = np.array([terrain.BARRIER, 4, 3, 2, 1, 0], dtype=np.uint8)
+    return terrain.Grid(lookup[levels])
+
+def slope_field(size, seed):
+    # Smooth value noise (bilinear octaves) used as a heightmap, turned into continuous costs like img_to_grid.py --slope.
+    # Hills are up to a tenth of the map size high, so the steepest slopes become barriers.
+    rng = np.random.default_rng(seed)
+    heights = np.zeros((size, size))
+    for octave in range(2, 7):
+        cells = 1 << octave
+        coarse = Image.fromarray(rng.random((cells + 1, cells + 1)).astype(np.float32))
+        heights += np.asarray(coarse.resize((size, size), Image.BILINEAR)) / octave
+    heights = size / 10 * (heights - heights.min()) / max(np.ptp(heights), 1e-9)
+    return terrain.Grid(terrain.slope_costs(heights, SLOPE_LIMIT, 4))
+
+SYNTHETIC_MAPS = {
+    "random": random_obstacles,
+    "maze": maze,
+    "fivesplit": fivesplit_field,
+    "slope": slope_field,
+}
+
+def make_queries(grid, count, seed):
+    # Fixed start/goal pairs for a map: the same seed always gives the same free nodes
+    rng = random.Random(seed)
+    free = np.flatnonzero(grid.costs.reshape(-1) != grid.barrier)
+    queries = []
+    if len(free) < 2:
+        return queries
+    for _ in range(count):
+        start, goal = rng.sample(range(len(free)), 2)
+        queries.append((grid.pos(int(free[start])), grid.pos(int(free[goal]))))
+    return queries
+
+def run_queries(grid, queries, heuristic):
+    # Returns the total wall time and the result of every query
+    results = []
+    start_time = time.perf_counter()
+    for start, goal in queries:
+        results.append(engine.find_path(grid, start, goal, heuristic))
+    return time.perf_counter() - start_time, results
+
+def peak_memory(grid, query, heuristic):
+    # Traced in a separate run, since tracing allocations slows the search down too much to time it at the same time
+    grid.workspace = None # Count the search state the query allocates too
+    tracemalloc.start()
+    engine.find_path(grid, query[0], query[1], heuristic)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def total_stats(query_results):
+    # Search stats summed over all queries (peak open list size is the largest of any query), or None if the
+    # searches don't report stats
+    stats = [result.stats.as_dict() for result in query_results if result.stats]
+    if not stats:
+        return None
+    total = {key: sum(query[key] for query in stats) for key in stats[0]}
+    total["peak_open"] = max(query["peak_open"] for query in stats)
+    return total
+
+def benchmark_map(name, kind, grid, load_time, heuristics, query_count, seed, measure_memory):
+    results = []
+    queries = make_queries(grid, query_count, seed)
+    for heuristic in heuristics:
+        wall_time, query_results = run_queries(grid, queries, heuristic)
+        found = sum(result.found for result in query_results)
+        nodes_expanded = sum(result.nodes_explored for result in query_results)
+        # Peak memory is measured on the query that expanded the most nodes
+        largest = max(range(len(queries)), key=lambda i: query_results[i].nodes_explored) if queries else None
+        result = {
+            "map": name,
+            "kind": kind,
+            "width": grid.width,
+            "height": grid.height,
+            "heuristic": heuristic,
+            "queries": len(queries),
+            "found": found,
+            "load_time": load_time,
+            "wall_time": wall_time,
+            "mean_time": wall_time / len(queries) if queries else 0.0,
+            "nodes_expanded": nodes_expanded,
+            "mean_nodes_expanded": nodes_expanded / len(queries) if queries else 0.0,
+            "queries_per_second": len(queries) / wall_time if wall_time else 0.0,
+            "peak_memory_bytes": peak_memory(grid, queries[largest], heuristic) if measure_memory and queries else None,
+            "stats": total_stats(query_results),
+        }
+        print(f"{name:34s} {heuristic:10s} {result['mean_time'] * 1000:10.2f} ms/query "
+            f"{result['mean_nodes_expanded']:12.1f} expanded {result['queries_per_second']:9.2f} q/s", file=sys.stderr)
+        results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search engine over the bundled maps and synthetic terrain. Writes JSON.")
+    parser.add_argument("--maps", type=str, nargs="*", help="Map images in the maps subdirectory. Defaults to every *.out.png and *.out.npy map.")
+    parser.add_argument("--synthetic", type=str, nargs="*", choices=list(SYNTHETIC_MAPS), default=list(SYNTHETIC_MAPS), help="Synthetic map kinds to generate.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128, 512], help="Width/height of each synthetic map, up to 4096.")
+    parser.add_argument("--heuristics", type=str, nargs="+", choices=engine.CHOICES, default=list(engine.HEURISTICS), help="Heuristics to run every query set with.")
+    parser.add_argument("--queries", type=int, default=20, help="Number of start/goal queries per map.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic maps and query sets.")
+    parser.add_argument("--skip_memory", action="store_true", help="Skip the extra traced run that measures peak memory.")
+    parser.add_argument("--output", type=str, help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        if size < 2 or size > 4096:
+            print("ERR: Synthetic map sizes must be between 2 and 4096.")
+            quit()
+
+    results = []
+    map_paths = [os.path.join(engine.MAPS_DIR, name) for name in args.maps] if args.maps is not None else [os.path.join(engine.MAPS_DIR, name) for name in terrain.map_names(engine.MAPS_DIR)]
+    for map_path in map_paths:
+        load_start_time = time.perf_counter()
+        grid = terrain.load_grid(map_path)
+        load_time = time.perf_counter() - load_start_time
+        results += benchmark_map(os.path.basename(map_path), "map", grid, load_time, args.heuristics, args.queries, args.seed, not args.skip_memory)
+
+    for kind in args.synthetic:
+        for size in args.sizes:
+            load_start_time = time.perf_counter()
+            grid = SYNTHETIC_MAPS[kind](size, args.seed)
+            load_time = time.perf_counter() - load_start_time
+            results += benchmark_map(f"{kind}_{size}", kind, grid, load_time, args.heuristics, args.queries, args.seed, not args.skip_memory)
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "queries_per_map": args.queries,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
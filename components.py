@@ -0,0 +1,215 @@
+import os
+import numpy as np
+import terrain
+from collections import deque
+
+# Diagonal moves are only allowed when both cardinal nodes beside them are free, so any diagonal
+# move can also be made as two cardinal moves. Components are therefore the same for every heuristic,
+# and labeling with 4-connectivity is enough.
+
+def label_components(grid):
+    # Labels every free node with its component id (1, 2, ...) and barriers with 0.
+    # Works on runs of free nodes along each column rather than on single nodes: runs are unioned with
+    # the runs they touch in the previous column, then every run is filled with its root's label.
+    free = grid.costs != grid.barrier
+    parent = []
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    columns = []
+    previous = []
+    for x in range(grid.width):
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], free[x], [False])).astype(np.int8)))
+        runs = []
+        for begin, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            run = len(parent)
+            parent.append(run)
+            runs.append((begin, end, run))
+
+        # Union with overlapping runs of the previous column (both lists are sorted)
+        i = 0
+        for begin, end, run in runs:
+            while i < len(previous) and previous[i][1] <= begin:
+                i += 1
+            j = i
+            while j < len(previous) and previous[j][0] < end:
+                root_a, root_b = find(run), find(previous[j][2])
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+                j += 1
+        columns.append(runs)
+        previous = runs
+
+    labels = np.zeros((grid.width, grid.height), dtype=np.int32)
+    root_labels = {}
+    for x, runs in enumerate(columns):
+        for begin, end, run in runs:
+            root = find(run)
+            if root not in root_labels:
+                root_labels[root] = len(root_labels) + 1
+            labels[x, begin:end] = root_labels[root]
+    return labels
+
+class Components:
+    # Connected component index of a grid. Answers reachability with one label comparison, and is
+    # updated incrementally by the grid's set_cell when a node turns into a barrier or is freed.
+    def __init__(self, grid, labels):
+        self.grid = grid
+        self.labels = labels
+        self.flat = labels.reshape(-1)
+        counts = np.bincount(self.flat)
+        self.sizes = {label: int(count) for label, count in enumerate(counts.tolist()) if label and count}
+        self.next_label = len(counts)
+
+    def copy(self, grid):
+        return Components(grid, self.labels.copy())
+
+    def label(self, pos):
+        return int(self.flat[self.grid.index(pos)])
+
+    def connected(self, start, goal):
+        start_label = self.label(start)
+        return start_label != 0 and start_label == self.label(goal)
+
+    def free_neighbors(self, index):
+        height = self.grid.height
+        x, y = divmod(index, height)
+        neighbors = []
+        if x > 0:
+            neighbors.append(index - height)
+        if x < self.grid.width - 1:
+            neighbors.append(index + height)
+        if y > 0:
+            neighbors.append(index - 1)
+        if y < height - 1:
+            neighbors.append(index + 1)
+        return [neighbor for neighbor in neighbors if self.flat[neighbor]]
+
+    def update(self, index, old_cost, new_cost):
+        barrier = self.grid.barrier
+        if (old_cost == barrier) == (new_cost == barrier):
+            return # Only a cost change, connectivity stays the same
+        if new_cost == barrier:
+            self.remove_node(index)
+        else:
+            self.add_node(index)
+
+    def relabel(self, seed, old_label, new_label):
+        # Flood fill the nodes connected to seed that carry old_label
+        flat = self.flat
+        flat[seed] = new_label
+        queue = deque([seed])
+        count = 0
+        while queue:
+            current = queue.popleft()
+            count += 1
+            for neighbor in self.free_neighbors(current):
+                if flat[neighbor] == old_label:
+                    flat[neighbor] = new_label
+                    queue.append(neighbor)
+        return count
+
+    def remove_node(self, index):
+        # A new barrier can split its component. A search is grown from every free neighbor in lockstep, one node
+        # each per round, and two searches that meet are merged. A search that runs out of nodes has found a
+        # whole piece that was cut off, which gets a new label. Once only one search is left, it's the rest of
+        # the component and keeps the old label, so the work is about the size of the smaller pieces.
+        flat = self.flat
+        label = int(flat[index])
+        flat[index] = 0
+        self.sizes[label] -= 1
+        if not self.sizes[label]:
+            del self.sizes[label]
+        pending = self.free_neighbors(index)
+        if len(pending) < 2:
+            return
+        parent = list(range(len(pending))) # Searches that met are merged into one
+
+        def find(search):
+            while parent[search] != search:
+                parent[search] = parent[parent[search]]
+                search = parent[search]
+            return search
+
+        owner = {node: search for search, node in enumerate(pending)} # Search that reached each node first
+        visited = [[node] for node in pending]
+        queues = [deque([node]) for node in pending]
+        active = list(range(len(pending)))
+        left = len(active)
+        while left > 1:
+            for search in active:
+                if left == 1:
+                    break
+                if parent[search] != search:
+                    continue # Merged into another search this round
+                queue = queues[search]
+                if not queue:
+                    # Cut off: visited is the whole piece, so give it a new label
+                    new_label = self.next_label
+                    self.next_label += 1
+                    for node in visited[search]:
+                        flat[node] = new_label
+                    self.sizes[new_label] = len(visited[search])
+                    self.sizes[label] -= len(visited[search])
+                    parent[search] = -1
+                    left -= 1
+                    continue
+                current = queue.popleft()
+                for neighbor in self.free_neighbors(current):
+                    other = owner.get(neighbor)
+                    if other is None:
+                        owner[neighbor] = search
+                        visited[search].append(neighbor)
+                        queue.append(neighbor)
+                        continue
+                    other = find(other)
+                    if other != search:
+                        # Same piece: carry on as one search
+                        parent[other] = search
+                        visited[search] += visited[other]
+                        queue.extend(queues[other])
+                        visited[other] = queues[other] = None
+                        left -= 1
+            active = [search for search in active if parent[search] == search]
+
+    def add_node(self, index):
+        # A freed node joins the components around it, merging them into the largest one
+        flat = self.flat
+        labels = {int(flat[neighbor]) for neighbor in self.free_neighbors(index)}
+        if not labels:
+            label = self.next_label
+            self.next_label += 1
+            self.sizes[label] = 0
+        else:
+            label = max(labels, key=lambda l: self.sizes[l])
+        for neighbor in self.free_neighbors(index):
+            other = int(flat[neighbor])
+            if other != label:
+                self.sizes[label] += self.relabel(neighbor, other, label)
+                del self.sizes[other]
+        flat[index] = label
+        self.sizes[label] += 1
+
+def get_components(grid):
+    # Component index of a grid, built once and then kept on the grid. For unedited maps the labels are
+    # cached next to the compiled map, so they are only computed the first time a map is used.
+    if grid.components is not None:
+        return grid.components
+    labels_path = terrain.derived_path(grid, "labels.npy")
+    labels = None
+    if labels_path and os.path.exists(labels_path):
+        labels = np.load(labels_path)
+    if labels is None or labels.shape != grid.costs.shape:
+        labels = label_components(grid)
+        if labels_path:
+            try:
+                os.makedirs(os.path.dirname(labels_path), exist_ok=True)
+                terrain.write_atomic(labels_path, lambda f: np.save(f, labels))
+            except OSError:
+                pass
+    grid.components = Components(grid, labels)
+    return grid.components
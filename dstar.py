@@ -0,0 +1,208 @@
+import heapq
+import time
+import engine
+from array import array
+
+# Incremental replanning with D* Lite. The search runs backwards from the goal and keeps its state between
+# plans, so when cells change only the part of the search that depended on them is repaired, instead of
+# searching the whole map again. Useful when a rover keeps discovering obstacles on the way to the same goal.
+#
+# g[node] is the current cost estimate from node to the goal, rhs[node] the one-step lookahead value
+# min(move cost + g[successor]). A node is consistent when both agree; plan() only touches inconsistent ones.
+
+INF = float("inf")
+# The same cost summed along different moves can differ in its last bits.
+# Keys are rounded to KEY_DIGITS decimals so such ties order the same way as they would exactly, and costs
+# are compared with a tolerance of EPSILON.
+KEY_DIGITS = 9
+EPSILON = 1e-9
+
+def same_cost(a, b):
+    return a == b or abs(a - b) <= EPSILON
+
+class DStarLite:
+    def __init__(self, grid, start_pos, goal_pos, heuristic):
+        self.grid = grid
+        self.diagonal = engine.is_diagonal(heuristic)
+        self.h_function = engine.HEURISTICS.get(heuristic, engine.octile)
+        self.start = grid.index(start_pos)
+        self.goal = grid.index(goal_pos)
+        self.last_start = self.start
+        self.km = 0 # Added to every key when the start moves, so queued keys don't need recomputing
+        self.g = array("d", [INF]) * len(grid)
+        self.rhs = array("d", [INF]) * len(grid)
+        self.rhs[self.goal] = 0
+        self.open_list = []
+        self.open_keys = {} # Current key of every queued node; heap entries with another key are stale
+        self.count = 0 # Pushes so far
+        self.heuristic_evaluations = 0
+        self.changed = set() # Cells edited since the last plan
+        self.push(self.goal, self.key(self.goal))
+        grid.watchers.append(self.on_change)
+
+    def close(self):
+        # Stops following edits to the grid
+        if self.on_change in self.grid.watchers:
+            self.grid.watchers.remove(self.on_change)
+
+    def on_change(self, index, old_cost, new_cost):
+        self.changed.add(index)
+
+    def key(self, index):
+        best = min(self.g[index], self.rhs[index])
+        x1, y1 = divmod(self.start, self.grid.height)
+        x2, y2 = divmod(index, self.grid.height)
+        self.heuristic_evaluations += 1
+        return (round(best + self.h_function(abs(x1 - x2), abs(y1 - y2)) + self.km, KEY_DIGITS), round(best, KEY_DIGITS))
+
+    def push(self, index, key):
+        self.count += 1
+        self.open_keys[index] = key
+        heapq.heappush(self.open_list, (key, self.count, index))
+
+    def top(self):
+        # Smallest valid (key, node) in the open list, dropping stale entries on the way
+        while self.open_list:
+            key, _, index = self.open_list[0]
+            if self.open_keys.get(index) == key:
+                return key, index
+            heapq.heappop(self.open_list)
+        return (INF, INF), None
+
+    def queue(self, index):
+        # Queues a node while it's inconsistent and takes it off the queue once it isn't
+        if self.g[index] != self.rhs[index]:
+            self.push(index, self.key(index))
+        else:
+            self.open_keys.pop(index, None)
+
+    def lookahead(self, index):
+        # rhs of a node: the cheapest move to a successor plus that successor's cost to the goal
+        if index == self.goal:
+            return 0
+        if self.grid.cells[index] == self.grid.barrier:
+            return INF
+        g = self.g
+        best = INF
+        for neighbor, move_cost in engine.get_neighbors(self.grid, index, self.diagonal):
+            cost = move_cost + g[neighbor]
+            if cost < best:
+                best = cost
+        return best
+
+    def predecessors(self, index):
+        # (node, cost of moving from node onto index) for every node that can move onto index.
+        # Costs are built the same way get_neighbors builds them, so they compare exactly with rhs values.
+        if self.grid.cells[index] == self.grid.barrier:
+            return []
+        return [(neighbor, engine.reverse_move_cost(self.grid, index, neighbor))
+            for neighbor, _ in engine.get_neighbors(self.grid, index, self.diagonal)]
+
+    def around(self, index):
+        # Every node within one step, barrier or not. Their edges to index (and, for diagonals, across
+        # the corner next to index) are the ones that change when index does.
+        grid = self.grid
+        x, y = divmod(index, grid.height)
+        if self.diagonal:
+            nearby = [(x + dx, y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+        else:
+            nearby = [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+        return [grid.index(pos) for pos in nearby if grid.in_bounds(pos)]
+
+    def move_start(self, start_pos):
+        # For a rover that has moved along the path: plans from here on start from start_pos
+        height = self.grid.height
+        x1, y1 = divmod(self.last_start, height)
+        x2, y2 = start_pos
+        self.km += self.h_function(abs(x1 - x2), abs(y1 - y2))
+        self.start = self.grid.index(start_pos)
+        self.last_start = self.start
+
+    def plan(self, visit=None):
+        # Repairs the search after any edits since the last plan and returns the current best path as a
+        # SearchResult. nodes_explored and the stats only count what this call did; setup is taking the edits
+        # in, and a reopen is a node expanded again within the same call.
+        start_time = time.time()
+        stats = engine.SearchStats()
+        pushes = self.count
+        heuristic_evaluations = self.heuristic_evaluations
+        g = self.g
+        rhs = self.rhs
+        for index in self.changed:
+            for node in [index] + self.around(index):
+                rhs[node] = self.lookahead(node)
+                self.queue(node)
+        self.changed.clear()
+
+        start = self.start
+        goal = self.goal
+        nodes_explored = 0
+        expanded = set()
+        stats.end_phase("setup")
+        while True:
+            if len(self.open_list) > stats.peak_open:
+                stats.peak_open = len(self.open_list)
+            key, current = self.top()
+            if current is None or (key >= self.key(start) and same_cost(rhs[start], g[start])):
+                break
+            nodes_explored += 1
+            new_key = self.key(current)
+            if key < new_key:
+                self.push(current, new_key) # Key went up since it was queued (the start moved)
+                continue
+
+            del self.open_keys[current]
+            if current in expanded:
+                stats.reopens += 1
+            expanded.add(current)
+            current_rhs = rhs[current]
+            if g[current] > current_rhs:
+                # Cost to the goal went down: it can only lower the lookahead of nodes moving onto current
+                g[current] = current_rhs
+                for node, move_cost in self.predecessors(current):
+                    if node != goal and move_cost + current_rhs < rhs[node]:
+                        rhs[node] = move_cost + current_rhs
+                        self.queue(node)
+                        if visit:
+                            visit("open", self.grid.pos(node))
+            else:
+                # Cost to the goal went up: only nodes whose lookahead went through current need recomputing
+                old_g = g[current]
+                g[current] = INF
+                for node, move_cost in self.predecessors(current) + [(current, None)]:
+                    if node != goal and (node == current or same_cost(rhs[node], move_cost + old_g)):
+                        rhs[node] = self.lookahead(node)
+                    self.queue(node)
+            if visit:
+                visit("closed", self.grid.pos(current))
+
+        stats.end_phase("search")
+        cost = g[start] if same_cost(rhs[start], g[start]) else INF
+        path = self.path() if cost != INF else []
+        if path:
+            stats.end_phase("reconstruction")
+        stats.expansions = nodes_explored
+        stats.pushes = self.count - pushes
+        stats.heuristic_evaluations = self.heuristic_evaluations - heuristic_evaluations
+        return engine.SearchResult(path, cost, nodes_explored, time.time() - start_time, stats=stats)
+
+    def path(self):
+        # Follows the cheapest successors from the start down to the goal. Returns an empty path if that
+        # doesn't reach the goal within as many steps as there are nodes, since it must be going in circles.
+        g = self.g
+        current = self.start
+        path = [self.grid.pos(current)]
+        while current != self.goal:
+            if len(path) > len(self.grid):
+                return []
+            best_cost = INF
+            for neighbor, move_cost in engine.get_neighbors(self.grid, current, self.diagonal):
+                cost = move_cost + g[neighbor]
+                if cost < best_cost:
+                    best_cost = cost
+                    best = neighbor
+            if best_cost == INF:
+                return []
+            current = best
+            path.append(self.grid.pos(current))
+        return path
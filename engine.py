@@ -0,0 +1,837 @@
+import argparse
+import json
+import math
+import os
+import time
+import heapq
+import terrain
+import components
+import tiles
+import numpy as np
+from array import array
+
+# The search modes built on this module (jps, hpa, landmarks, anyangle, pathcache) all import it, so they're
+# imported where they're used. Importing them here would be circular, and only work in one import order.
+
+MAPS_DIR = "maps"
+SQRT2 = math.sqrt(2)
+FLAT_WORKSPACE_NODES = 1 << 24 # Grids with more nodes keep search state only for the nodes a query reaches
+
+# Called as hook(phase, seconds) at the end of each phase ("setup", "search", "reconstruction") of every
+# search that reports stats, so a caller can collect timings without changing the search calls
+PHASE_HOOKS = []
+
+class SearchStats:
+    # What one search did, for comparing heuristics and search modes without the visualizer. Times are in seconds.
+    def __init__(self):
+        self.expansions = 0
+        self.pushes = 0 # Open list insertions, stale ones included
+        self.reopens = 0 # Pushes of a node that was already expanded (closed), after finding a cheaper way to it
+        self.peak_open = 0 # Largest open list size, stale entries included
+        self.heuristic_evaluations = 0
+        self.setup_time = 0.0
+        self.search_time = 0.0
+        self.reconstruction_time = 0.0
+        self.phase_start = time.time()
+
+    def end_phase(self, phase):
+        # Adds the time since the previous phase ended to phase and passes it on to PHASE_HOOKS
+        now = time.time()
+        elapsed = now - self.phase_start
+        setattr(self, phase + "_time", getattr(self, phase + "_time") + elapsed)
+        self.phase_start = now
+        for hook in PHASE_HOOKS:
+            hook(phase, elapsed)
+
+    def as_dict(self):
+        return {key: value for key, value in vars(self).items() if key != "phase_start"}
+
+class SearchResult:
+    def __init__(self, path, cost, nodes_explored, elapsed, bound=None, stats=None, cached=False):
+        self.path = path # List of (x, y) positions from start to goal, empty if no path exists. Neighboring nodes,
+                         # except for any-angle and smoothed paths (anyangle.py), which hold only their waypoints.
+        self.cost = cost
+        self.nodes_explored = nodes_explored
+        self.elapsed = elapsed
+        self.bound = bound # Proven upper bound on cost / optimal cost, for searches that report one
+        self.stats = stats # SearchStats, for searches that report them (A*, weighted and bidirectional A*)
+        self.cached = cached # Returned from the path cache (pathcache.py) instead of searched
+
+    @property
+    def found(self):
+        return bool(self.path)
+
+def manhattan(dx, dy):
+    return dx + dy
+
+def euclidean(dx, dy):
+    return math.sqrt(dx * dx + dy * dy)
+
+def octile(dx, dy):
+    return max(dx, dy) + (SQRT2 - 1) * min(dx, dy)
+
+HEURISTICS = {
+    "manhattan": manhattan,
+    "euclidean": euclidean,
+    "octile": octile,
+}
+
+# "jps" is chosen like a heuristic but swaps out the whole search. Jump Point Search moves like octile.
+# "alt" is the landmark heuristic from landmarks.py, which needs the node itself rather than just its offset
+# from the goal. It moves like octile too.
+CHOICES = list(HEURISTICS) + ["alt", "jps"]
+
+def h(n1, n2, heuristic):
+    x1, y1 = n1
+    x2, y2 = n2
+    return HEURISTICS[heuristic.lower()](abs(x1 - x2), abs(y1 - y2))
+
+def is_diagonal(heuristic):
+    return heuristic != "manhattan" # Manhattan only allows cardinal movement
+
+def get_neighbors(grid, index, diagonal):
+    # Generated from the grid on demand, so no per-node neighbor lists are ever built.
+    # Returns (neighbor index, cost of moving there) pairs in the same order the directions were always checked:
+    # (1, 0), (-1, 0), (0, 1), (0, -1), then (1, 1), (1, -1), (-1, 1), (-1, -1)
+    cells = grid.cells
+    barrier = grid.barrier
+    height = grid.height
+    x, y = divmod(index, height)
+    east = index + height
+    west = index - height
+    south = index + 1
+    north = index - 1
+    free_east = x < grid.width - 1 and cells[east] != barrier
+    free_west = x > 0 and cells[west] != barrier
+    free_south = y < height - 1 and cells[south] != barrier
+    free_north = y > 0 and cells[north] != barrier
+
+    neighbors = []
+    if free_east:
+        neighbors.append((east, 1 + cells[east]))
+    if free_west:
+        neighbors.append((west, 1 + cells[west]))
+    if free_south:
+        neighbors.append((south, 1 + cells[south]))
+    if free_north:
+        neighbors.append((north, 1 + cells[north]))
+    if diagonal:
+        # No cutting corners: both cardinal cells next to a diagonal move must be free
+        if free_east and free_south and cells[east + 1] != barrier:
+            neighbors.append((east + 1, SQRT2 + cells[east + 1]))
+        if free_east and free_north and cells[east - 1] != barrier:
+            neighbors.append((east - 1, SQRT2 + cells[east - 1]))
+        if free_west and free_south and cells[west + 1] != barrier:
+            neighbors.append((west + 1, SQRT2 + cells[west + 1]))
+        if free_west and free_north and cells[west - 1] != barrier:
+            neighbors.append((west - 1, SQRT2 + cells[west - 1]))
+    return neighbors
+
+def reverse_move_cost(grid, index, neighbor):
+    # Cost of moving from neighbor onto index, for searches that run backwards along moves
+    height = grid.height
+    cardinal = neighbor // height == index // height or neighbor % height == index % height
+    return (1 if cardinal else SQRT2) + grid.cells[index]
+
+def is_reachable(grid, start, goal):
+    # O(1) once the grid's component index exists; it's the same for every heuristic (see components.py)
+    return components.get_components(grid).connected(start, goal)
+
+class HeapQueue:
+    # Binary heap open list. Entries are never updated in place; a node whose g score improves is pushed again
+    # and the stale entry is skipped when popped (lazy deletion). count keeps ties in insertion order.
+    def __init__(self):
+        self.heap = []
+        self.count = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, f, g, index):
+        self.count += 1
+        heapq.heappush(self.heap, (f, self.count, g, index))
+
+    def pop(self):
+        _, _, g, index = heapq.heappop(self.heap)
+        return g, index
+
+class BucketQueue:
+    # Open list for integer f scores, one bucket per f value. With a consistent heuristic f never decreases,
+    # so popping only ever scans forward from the current bucket.
+    def __init__(self):
+        self.buckets = []
+        self.current = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, f, g, index):
+        f = int(f) # Cached scores come back from the workspace as floats
+        while len(self.buckets) <= f:
+            self.buckets.append([])
+        self.buckets[f].append((g, index))
+        if f < self.current:
+            self.current = f
+        self.size += 1
+
+    def pop(self):
+        while not self.buckets[self.current]:
+            self.current += 1
+        self.size -= 1
+        return self.buckets[self.current].pop()
+
+class Workspace:
+    # Flat per-node search state, indexed by cell id and reused across queries on the same grid.
+    # An entry is only valid if its stamp matches the current generation, so starting a new query
+    # is a counter increment instead of an O(N) reset. Generations go up by 2, so searches that need to
+    # tell expanded (closed) nodes apart can stamp them with generation + 1.
+    def __init__(self, size):
+        self.size = size
+        self.generation = 0
+        self.stamp = array("I", bytes(4 * size))
+        self.g_score = array("d", bytes(8 * size))
+        self.h_score = array("d", bytes(8 * size))
+        self.came_from = array("q", bytes(8 * size))
+
+    def next_generation(self):
+        self.generation += 2
+        return self.generation
+
+class Stamps(dict):
+    # Nodes a query hasn't reached read as generation 0, which no query uses
+    def __missing__(self, index):
+        return 0
+
+class SparseWorkspace:
+    # Same search state as Workspace, but in dicts holding only the nodes the current query reached, for grids
+    # too large to give every node an entry (such as tiled maps). Starting a query clears them, so memory follows
+    # the size of the current search rather than of the grid.
+    def __init__(self, size):
+        self.size = size
+        self.generation = 0
+        self.stamp = Stamps()
+        self.g_score = {}
+        self.h_score = {}
+        self.came_from = {}
+
+    def next_generation(self):
+        for table in (self.stamp, self.g_score, self.h_score, self.came_from):
+            table.clear()
+        self.generation += 2
+        return self.generation
+
+def make_workspace(grid):
+    # Tiled grids (no single cost array) are meant to be larger than memory, so they never get flat arrays
+    if grid.costs is None or len(grid) > FLAT_WORKSPACE_NODES:
+        return SparseWorkspace(len(grid))
+    return Workspace(len(grid))
+
+def get_workspace(grid, backward=False):
+    # Searches that run from both ends at once use a second workspace for the backward half
+    if backward:
+        if grid.backward_workspace is None or grid.backward_workspace.size != len(grid):
+            grid.backward_workspace = make_workspace(grid)
+        return grid.backward_workspace
+    if grid.workspace is None or grid.workspace.size != len(grid):
+        grid.workspace = make_workspace(grid)
+    return grid.workspace
+
+def make_open_list(grid, heuristic):
+    # Manhattan runs on uint8 grids only ever produce small integer f scores, so a bucket queue can replace the
+    # heap. uint16 costs can reach f scores in the millions, and the queue keeps a bucket for every f up to the largest.
+    if heuristic == "manhattan" and grid.dtype == np.uint8:
+        return BucketQueue()
+    return HeapQueue()
+
+class ExpansionRecorder:
+    # visit callback that records which nodes searches expanded, for studying heuristics without the visualizer.
+    # order[x, y] is the step at which a node was first expanded (-1 if never) and heat[x, y] how many times
+    # it was expanded. Steps keep counting across searches, so recording a batch of queries sums their heat.
+    def __init__(self, grid):
+        self.order = np.full((grid.width, grid.height), -1, dtype=np.int64)
+        self.heat = np.zeros((grid.width, grid.height), dtype=np.uint32)
+        self.steps = 0
+
+    def __call__(self, event, pos):
+        if event != "closed":
+            return
+        self.heat[pos] += 1
+        if self.order[pos] < 0:
+            self.order[pos] = self.steps
+        self.steps += 1
+
+    def save(self, path):
+        # Both arrays in one .npz file, indexed [x, y] like the grid
+        np.savez(path, order=self.order, heat=self.heat)
+
+def reconstruct_path(grid, came_from, start, current):
+    path = [grid.pos(current)]
+    while current != start:
+        current = came_from[current]
+        path.append(grid.pos(current))
+    path.reverse()
+    return path
+
+# Compact forms of a path, for passing it on (to a rover, say) rather than drawing it
+
+def path_array(path):
+    # The path as an (n, 2) int32 array of x, y rows
+    return np.array(path, dtype=np.int32).reshape(-1, 2)
+
+def path_waypoints(path):
+    # Only the start, the goal and the nodes where the path changes direction
+    if len(path) < 3:
+        return list(path)
+    steps = np.diff(path_array(path), axis=0)
+    turns = np.flatnonzero((steps[1:] != steps[:-1]).any(axis=1)) + 1
+    return [path[0]] + [path[i] for i in turns] + [path[-1]]
+
+def encode_runs(path):
+    # Run-length encoding of the path: its start, then (dx, dy, count) for every run of equal steps
+    if not path:
+        return None, []
+    runs = []
+    for step in np.diff(path_array(path), axis=0).tolist():
+        if runs and runs[-1][:2] == step:
+            runs[-1][2] += 1
+        else:
+            runs.append(step + [1])
+    return tuple(path[0]), [tuple(run) for run in runs]
+
+def decode_runs(start, runs):
+    # The path encode_runs was given
+    if start is None:
+        return []
+    x, y = start
+    path = [(x, y)]
+    for dx, dy, count in runs:
+        for _ in range(count):
+            x += dx
+            y += dy
+            path.append((x, y))
+    return path
+
+def find_path(grid, start_pos, goal_pos, heuristic, visit=None, epsilon=0):
+    # visit, if supplied, is called as visit(event, pos) with event "open" or "closed" so a caller can follow the search.
+    # An epsilon above 0 runs weighted A*: f = g + (1 + epsilon) * h. Greedier than A*, so usually far fewer nodes
+    # are explored, and with a consistent heuristic the path costs at most (1 + epsilon) times the optimal cost.
+    # Nodes are reopened when a cheaper way to them is found, so when the goal is popped every open node still
+    # bounds the optimal cost from below by g + h. result.bound is cost / that lower bound, which is usually much
+    # tighter than 1 + epsilon.
+    if heuristic == "jps":
+        if epsilon:
+            raise ValueError("Jump Point Search has no weighted mode")
+        import jps
+        return jps.find_path(grid, start_pos, goal_pos, visit)
+    start_time = time.time()
+    stats = SearchStats()
+    if grid.components and not grid.components.connected(start_pos, goal_pos):
+        stats.end_phase("setup")
+        return SearchResult([], float("inf"), 0, time.time() - start_time, stats=stats) # Known unreachable without searching
+    weight = 1 + epsilon if epsilon else 1 # Kept an int without epsilon, so manhattan f scores stay integers
+    diagonal = is_diagonal(heuristic)
+    h_function = HEURISTICS.get(heuristic.lower(), octile) # Resolved once instead of on every call
+    node_h = None
+    if heuristic == "alt":
+        import landmarks
+        node_h = landmarks.make_heuristic(grid, goal_pos)
+    height = grid.height
+    start = grid.index(start_pos)
+    goal = grid.index(goal_pos)
+    goal_x, goal_y = goal_pos
+    workspace = get_workspace(grid)
+    generation = workspace.next_generation()
+    stamp = workspace.stamp
+    g_score = workspace.g_score # Current shortest distance from start node to each node
+    h_score = workspace.h_score # Heuristic of each node, computed the first time a query reaches it
+    came_from = workspace.came_from
+    nodes_explored = 0
+
+    open_list = HeapQueue() if epsilon else make_open_list(grid, heuristic)
+    push = open_list.push
+    pop = open_list.pop
+    stamp[start] = generation
+    g_score[start] = 0
+    h_score[start] = node_h(start) if node_h else h_function(abs(start_pos[0] - goal_x), abs(start_pos[1] - goal_y))
+    push(weight * h_score[start], 0, start) # Start with the start node in the open set
+    stats.end_phase("setup")
+
+    # Every push either evaluates the heuristic of a newly reached node or improves the g score of one.
+    # Improving a node that was already expanded reopens it.
+    closed = generation + 1
+    heuristic_evaluations = 1
+    improvements = 0
+    reopens = 0
+    peak_open = 0
+    path = []
+    cost = float("inf")
+    bound = None
+    while open_list:
+        if len(open_list) > peak_open:
+            peak_open = len(open_list)
+        current_g, current = pop()
+        if current_g > g_score[current]:
+            continue # Stale entry, this node was pushed again with a better g score
+        stamp[current] = closed
+        nodes_explored += 1
+
+        if current == goal:
+            if epsilon:
+                lower_bound = current_g
+                for _, _, g, index in open_list.heap:
+                    if g == g_score[index]: # Skip stale entries
+                        lower_bound = min(lower_bound, g + h_score[index])
+                bound = current_g / lower_bound if lower_bound else 1.0
+            stats.end_phase("search")
+            path = reconstruct_path(grid, came_from, start, goal)
+            cost = current_g
+            break
+
+        for neighbor, move_cost in get_neighbors(grid, current, diagonal):
+            # Move cost already includes the extra edge weight of the neighbor
+            temp_g_score = current_g + move_cost
+            neighbor_stamp = stamp[neighbor]
+            if neighbor_stamp < generation:
+                stamp[neighbor] = generation
+                heuristic_evaluations += 1
+                if node_h:
+                    h_neighbor = h_score[neighbor] = node_h(neighbor)
+                else:
+                    neighbor_x, neighbor_y = divmod(neighbor, height)
+                    h_neighbor = h_score[neighbor] = h_function(abs(neighbor_x - goal_x), abs(neighbor_y - goal_y))
+            elif temp_g_score < g_score[neighbor]:
+                improvements += 1
+                if neighbor_stamp == closed:
+                    stamp[neighbor] = generation
+                    reopens += 1
+                h_neighbor = h_score[neighbor]
+            else:
+                continue
+
+            came_from[neighbor] = current
+            g_score[neighbor] = temp_g_score
+            push(temp_g_score + weight * h_neighbor, temp_g_score, neighbor)
+            if visit:
+                visit("open", grid.pos(neighbor))
+
+        if visit:
+            visit("closed", grid.pos(current))
+
+    stats.end_phase("reconstruction" if path else "search")
+    stats.expansions = nodes_explored
+    stats.pushes = heuristic_evaluations + improvements
+    stats.reopens = reopens
+    stats.peak_open = peak_open
+    stats.heuristic_evaluations = heuristic_evaluations
+    return SearchResult(path, cost, nodes_explored, time.time() - start_time, bound, stats)
+
+def find_path_bidirectional(grid, start_pos, goal_pos, heuristic, visit=None):
+    # Bidirectional A*: one search from the start and one backwards from the goal, each step expanding the side
+    # with the smaller open list. mu is the cheapest path found so far through a node both sides have reached.
+    # Any path not found yet passes through an open node of each side, so once the smallest f of either side
+    # reaches mu, no cheaper path is left and the result is optimal.
+    # The backward side needs a heuristic towards the start, so "alt" uses octile here.
+    start_time = time.time()
+    stats = SearchStats()
+    if grid.components and not grid.components.connected(start_pos, goal_pos):
+        stats.end_phase("setup")
+        return SearchResult([], float("inf"), 0, time.time() - start_time, stats=stats)
+    diagonal = is_diagonal(heuristic)
+    h_function = HEURISTICS.get(heuristic.lower(), octile)
+    height = grid.height
+    start = grid.index(start_pos)
+    goal = grid.index(goal_pos)
+    if start == goal:
+        stats.end_phase("setup")
+        return SearchResult([start_pos], 0, 0, time.time() - start_time, 1.0, stats)
+    nodes_explored = 0
+
+    # Per side: (workspace, generation, open list, node the heuristic aims at, is backward)
+    sides = []
+    for source, target, backward in ((start, goal, False), (goal, start, True)):
+        workspace = get_workspace(grid, backward)
+        generation = workspace.next_generation()
+        workspace.stamp[source] = generation
+        workspace.g_score[source] = 0
+        workspace.came_from[source] = source
+        open_list = HeapQueue()
+        open_list.push(0, 0, source)
+        sides.append((workspace, generation, open_list, divmod(target, height), backward))
+
+    stats.end_phase("setup")
+
+    # Both sides evaluate the heuristic on every push except their first
+    pushes = 2
+    reopens = 0
+    peak_open = 0
+    mu = float("inf")
+    meeting = None
+    while sides[0][2] and sides[1][2]:
+        if len(sides[0][2]) + len(sides[1][2]) > peak_open:
+            peak_open = len(sides[0][2]) + len(sides[1][2])
+        # Stop once either side can't improve on mu. Stale entries only make the smallest f look smaller.
+        if max(sides[0][2].heap[0][0], sides[1][2].heap[0][0]) >= mu:
+            break
+        side, other = (sides[0], sides[1]) if len(sides[0][2]) <= len(sides[1][2]) else (sides[1], sides[0])
+        workspace, generation, open_list, (target_x, target_y), backward = side
+        other_workspace, other_generation = other[0], other[1]
+        stamp, g_score, came_from = workspace.stamp, workspace.g_score, workspace.came_from
+
+        current_f = open_list.heap[0][0]
+        current_g, current = open_list.pop()
+        if current_g > g_score[current] or current_f >= mu:
+            continue # Stale, or can't lead to a path cheaper than mu
+        stamp[current] = generation + 1 # Closed
+        nodes_explored += 1
+
+        for neighbor, move_cost in get_neighbors(grid, current, diagonal):
+            if backward:
+                move_cost = reverse_move_cost(grid, current, neighbor)
+            temp_g_score = current_g + move_cost
+            if stamp[neighbor] >= generation:
+                if temp_g_score >= g_score[neighbor]:
+                    continue
+                if stamp[neighbor] > generation:
+                    reopens += 1
+            pushes += 1
+            stamp[neighbor] = generation
+            g_score[neighbor] = temp_g_score
+            came_from[neighbor] = current
+            neighbor_x, neighbor_y = divmod(neighbor, height)
+            open_list.push(temp_g_score + h_function(abs(neighbor_x - target_x), abs(neighbor_y - target_y)), temp_g_score, neighbor)
+            if other_workspace.stamp[neighbor] >= other_generation and temp_g_score + other_workspace.g_score[neighbor] < mu:
+                mu = temp_g_score + other_workspace.g_score[neighbor]
+                meeting = neighbor
+            if visit:
+                visit("open", (neighbor_x, neighbor_y))
+
+        if visit:
+            visit("closed", grid.pos(current))
+
+    stats.end_phase("search")
+    stats.expansions = nodes_explored
+    stats.pushes = pushes
+    stats.reopens = reopens
+    stats.peak_open = peak_open
+    stats.heuristic_evaluations = pushes - 2
+    if meeting is None:
+        return SearchResult([], float("inf"), nodes_explored, time.time() - start_time, stats=stats)
+    forward_half = reconstruct_path(grid, sides[0][0].came_from, start, meeting)
+    backward_half = reconstruct_path(grid, sides[1][0].came_from, goal, meeting)
+    path = forward_half + backward_half[-2::-1]
+    stats.end_phase("reconstruction")
+    return SearchResult(path, mu, nodes_explored, time.time() - start_time, 1.0, stats)
+
+def dijkstra(grid, source_pos, heuristic, targets=None, reverse=False):
+    # One-to-many search from source_pos using the movement rules of heuristic.
+    # Returns {target: cost} for every target position (inf if unreachable) and stops as soon as all of them are settled.
+    # Without targets, the whole reachable area is searched and every settled node is returned.
+    # With reverse, costs are from each node to source_pos instead (they differ, since entering a node pays its extra cost).
+    diagonal = is_diagonal(heuristic)
+    source = grid.index(source_pos)
+    workspace = get_workspace(grid)
+    generation = workspace.next_generation()
+    stamp = workspace.stamp
+    g_score = workspace.g_score
+    remaining = {grid.index(target) for target in targets} if targets is not None else None
+    settled = {}
+
+    open_list = HeapQueue()
+    stamp[source] = generation
+    g_score[source] = 0
+    open_list.push(0, 0, source)
+    while open_list:
+        current_g, current = open_list.pop()
+        if current_g > g_score[current]:
+            continue
+        if remaining is None:
+            settled[current] = current_g
+        elif current in remaining:
+            settled[current] = current_g
+            remaining.discard(current)
+            if not remaining:
+                break
+
+        for neighbor, move_cost in get_neighbors(grid, current, diagonal):
+            if reverse:
+                move_cost = reverse_move_cost(grid, current, neighbor)
+            temp_g_score = current_g + move_cost
+            if stamp[neighbor] != generation or temp_g_score < g_score[neighbor]:
+                stamp[neighbor] = generation
+                g_score[neighbor] = temp_g_score
+                open_list.push(temp_g_score, temp_g_score, neighbor)
+
+    if targets is None:
+        return {grid.pos(index): cost for index, cost in settled.items()}
+    return {target: settled.get(grid.index(target), float("inf")) for target in targets}
+
+def heuristic_array(grid, goal_pos, heuristic):
+    # Heuristic of every node at once, as a float array indexed [x, y]
+    dx = np.abs(np.arange(grid.width) - goal_pos[0])[:, None].astype(np.float64)
+    dy = np.abs(np.arange(grid.height) - goal_pos[1])[None, :].astype(np.float64)
+    if heuristic == "manhattan":
+        return dx + dy
+    if heuristic == "euclidean":
+        return np.sqrt(dx ** 2 + dy ** 2)
+    if heuristic == "alt":
+        import landmarks
+        return landmarks.heuristic_array(grid, goal_pos)
+    return np.maximum(dx, dy) + (SQRT2 - 1) * np.minimum(dx, dy)
+
+def audit_heuristic(grid, goal_pos, heuristic, path=None):
+    # Checks the heuristic outside of the search loop and returns aggregate violation counts.
+    # Consistency is checked over every edge of the grid: h(node) <= move cost + h(neighbor).
+    # Admissibility is checked over every node of path, if given: h(node) <= actual remaining cost.
+    heuristic = heuristic.lower()
+    heuristics = heuristic_array(grid, goal_pos, heuristic)
+    free = grid.costs != grid.barrier
+    extra = grid.costs.astype(np.float64)
+    width, height = grid.width, grid.height
+    directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+    if is_diagonal(heuristic):
+        directions += [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+    edges_checked = 0
+    inconsistent_edges = 0
+    worst_consistency = 0.0
+    for dx, dy in directions:
+        def at(values, ox, oy):
+            # values at (x + ox, y + oy) for every node (x, y) whose (dx, dy) neighbor is on the grid
+            x0, y0 = max(-dx, 0) + ox, max(-dy, 0) + oy
+            return values[x0:x0 + width - abs(dx), y0:y0 + height - abs(dy)]
+
+        valid = at(free, 0, 0) & at(free, dx, dy)
+        if dx and dy:
+            valid &= at(free, dx, 0) & at(free, 0, dy) # No cutting corners
+        move_cost = (SQRT2 if dx and dy else 1) + at(extra, dx, dy)
+        violation = (at(heuristics, 0, 0) - move_cost - at(heuristics, dx, dy))[valid]
+        edges_checked += violation.size
+        inconsistent_edges += int(np.count_nonzero(violation > 1e-5))
+        if violation.size:
+            worst_consistency = max(worst_consistency, float(violation.max()))
+
+    path_nodes_checked = 0
+    inadmissible_nodes = 0
+    worst_admissibility = 0.0
+    if path:
+        remaining = 0.0
+        for i in range(len(path) - 1, -1, -1):
+            x, y = path[i]
+            if i < len(path) - 1:
+                next_x, next_y = path[i + 1]
+                remaining += (SQRT2 if x != next_x and y != next_y else 1) + grid.extra_cost(path[i + 1])
+            over = float(heuristics[x, y]) - remaining
+            path_nodes_checked += 1
+            if over > 1e-5:
+                inadmissible_nodes += 1
+            worst_admissibility = max(worst_admissibility, over)
+
+    return {
+        "edges_checked": edges_checked,
+        "inconsistent_edges": inconsistent_edges,
+        "worst_consistency_violation": worst_consistency,
+        "path_nodes_checked": path_nodes_checked,
+        "inadmissible_nodes": inadmissible_nodes,
+        "worst_admissibility_violation": worst_admissibility,
+    }
+
+def print_result(result):
+    if result.cached:
+        print("\nFrom the path cache. Spaces explored are those of the original search.")
+    if not result.found:
+        print(f"\nUnable to find a path.\nExecution time: {result.elapsed:.4f} seconds\nTotal spaces explored: {result.nodes_explored}")
+        return
+    print(f"\nPath successfully found.\nExecution time: {result.elapsed:.4f} seconds\nTotal path cost: {result.cost:.4f}\nTotal spaces explored: {result.nodes_explored}")
+    if result.bound is not None:
+        print(f"Path cost is at most {result.bound:.4f} times the optimal cost.")
+
+def format_path(path, encoding):
+    # One line of the path as every node ("cells"), its waypoints, or its runs of equal steps. The nodes along
+    # the segments of any-angle and smoothed paths are filled in for "cells" and "runs".
+    if encoding == "waypoints":
+        return " ".join(f"{x},{y}" for x, y in path_waypoints(path))
+    import anyangle
+    cells = anyangle.path_cells(path)
+    if encoding == "runs":
+        start, runs = encode_runs(cells)
+        return " ".join([f"{start[0]},{start[1]}" if start else ""] + [f"{dx},{dy}x{count}" for dx, dy, count in runs]).strip()
+    return " ".join(f"{x},{y}" for x, y in cells)
+
+def print_stats(stats):
+    if stats is None:
+        print("No search stats for this search mode.")
+        return
+    print(f"Expansions: {stats.expansions}\nPushes: {stats.pushes}\nReopens: {stats.reopens}\n"
+        f"Peak open list size: {stats.peak_open}\nHeuristic evaluations: {stats.heuristic_evaluations}\n"
+        f"Setup / search / reconstruction time: {stats.setup_time:.4f} / {stats.search_time:.4f} / {stats.reconstruction_time:.4f} seconds")
+
+def print_tiles(grid):
+    print(f"Tiles loaded: {grid.tile_loads} ({grid.tile_evictions} closed again, at most {grid.peak_open} of {grid.max_tiles} open at once)")
+
+def print_audit(audit):
+    if audit["inconsistent_edges"]:
+        print(f"INCONSISTENT! {audit['inconsistent_edges']} of {audit['edges_checked']} edges, "
+            f"worst overestimate: {audit['worst_consistency_violation']:.4f}")
+    else:
+        print(f"Heuristic appears CONSISTENT over all {audit['edges_checked']} edges.")
+    if not audit["path_nodes_checked"]:
+        return
+    if audit["inadmissible_nodes"]:
+        print(f"NOT ADMISSIBLE! {audit['inadmissible_nodes']} of {audit['path_nodes_checked']} path nodes, "
+            f"worst overestimate: {audit['worst_admissibility_violation']:.4f}")
+    else:
+        print(f"Heuristic appears ADMISSIBLE over all {audit['path_nodes_checked']} path nodes.")
+
+def read_queries(queries_path):
+    # One query per line in the form X1 Y1 X2 Y2. Blank lines and lines starting with # are skipped.
+    queries = []
+    with open(queries_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            x1, y1, x2, y2 = (int(val) for val in line.split())
+            queries.append(((x1, y1), (x2, y2)))
+    return queries
+
+def main():
+    import anyangle
+    import hpa
+    import pathcache
+    parser = argparse.ArgumentParser(description="Headless A* pathfinding. Never opens a window.")
+    parser.add_argument("heuristic", type=str, choices=CHOICES, help="Choose the heuristic function.")
+    parser.add_argument("--size", type=int, default=50, help="Grid size. Grid is square, so 'size' value will apply to height AND width of the grid.")
+    parser.add_argument("--height", type=int, help="Height of the grid, for a grid that isn't square. --size is then its width.")
+    parser.add_argument("--use_map", type=str, help="Choose an image to use for a predefined map. Overrides --size. A tiled map (<name>.tiles, see tiles.py) is searched without loading it whole.")
+    parser.add_argument("--max_tiles", type=int, default=tiles.MAX_TILES, help="Tiles of a tiled map kept open at once; the least recently used one is closed to open another.")
+    parser.add_argument("--path", type=int, nargs=4, metavar=("X1", "Y1", "X2", "Y2"), help="Find the path between two points.")
+    parser.add_argument("--queries", type=str, help="File of queries, one per line in the form X1 Y1 X2 Y2. Prints one result line per query.")
+    parser.add_argument("-p", "--precheck", action="store_true", help="Check the map's connected components to confirm that the start node can reach the end node")
+    parser.add_argument("--audit", action="store_true", help="Check the heuristic for consistency and admissibility and print the number of violations.")
+    parser.add_argument("--hierarchical", action="store_true", help="Use hierarchical pathfinding (HPA*). Much faster on large maps, but paths can be slightly longer than optimal.")
+    parser.add_argument("--cluster_size", type=int, default=hpa.CLUSTER_SIZE, help="Cluster width/height for --hierarchical.")
+    parser.add_argument("--bidirectional", action="store_true", help="Search from both the start and the goal at once. Paths stay optimal.")
+    parser.add_argument("--epsilon", type=float, default=0, help="Use weighted A*: explores fewer nodes, with a path cost guaranteed within (1 + epsilon) of optimal.")
+    parser.add_argument("--any_angle", action="store_true", help="Find any-angle paths with Theta*: straight segments between waypoints in any direction, instead of grid moves. Always uses the euclidean heuristic.")
+    parser.add_argument("--smooth", action="store_true", help="Shorten the path found into straight segments between waypoints wherever that costs no more.")
+    parser.add_argument("--print_path", type=str, choices=["cells", "waypoints", "runs"], help="Print the path: every node, only the waypoints, or the start followed by (dx, dy, count) runs of equal steps.")
+    parser.add_argument("--stats", action="store_true", help="Print the search stats of every query: expansions, pushes, reopens, peak open list size, heuristic evaluations and time per phase.")
+    parser.add_argument("--cache", type=int, nargs="?", const=pathcache.CACHE_SIZE, help="Reuse the results of queries already answered on the same, unchanged map, from a cache of this many paths kept between runs (1024 without a number).")
+    parser.add_argument("--export_expansions", type=str, help="Save which nodes the searches expanded, and in what order, to this .npz file.")
+    args = parser.parse_args()
+
+    if not args.path and not args.queries:
+        print("ERR: Supply either --path or --queries.")
+        quit()
+    if args.epsilon < 0:
+        print("ERR: --epsilon can't be negative.")
+        quit()
+    if args.cache is not None and args.cache < 1:
+        print("ERR: --cache must hold at least 1 path.")
+        quit()
+    if args.any_angle and (args.hierarchical or args.bidirectional or args.epsilon):
+        print("ERR: --any_angle can't be combined with --hierarchical, --bidirectional or --epsilon.")
+        quit()
+    if args.epsilon and (args.hierarchical or args.bidirectional or args.heuristic == "jps"):
+        print("ERR: --epsilon can't be combined with --hierarchical, --bidirectional or jps.")
+        quit()
+    if args.size < 1 or (args.height is not None and args.height < 1) or args.max_tiles < 1:
+        print("ERR: --size, --height and --max_tiles must be at least 1.")
+        quit()
+
+    tiled = args.use_map and tiles.is_tiled(args.use_map)
+    if tiled and (args.heuristic in ("alt", "jps") or args.hierarchical or args.precheck or args.audit or args.export_expansions):
+        # These need the whole cost array at once
+        print("ERR: Tiled maps can't be searched with alt or jps, or with --hierarchical, --precheck, --audit or --export_expansions.")
+        quit()
+
+    if args.use_map:
+        map_path = os.path.join(MAPS_DIR, args.use_map)
+        if not os.path.exists(map_path):
+            print(f"ERR: Could not find the map image at: {args.use_map}")
+            quit()
+        grid = tiles.load_tiled(map_path, args.max_tiles) if tiled else terrain.load_grid(map_path)
+    else:
+        grid = terrain.make_grid(args.size, args.height)
+
+    queries = read_queries(args.queries) if args.queries else [((args.path[0], args.path[1]), (args.path[2], args.path[3]))]
+    for start, goal in queries:
+        if not grid.in_bounds(start) or not grid.in_bounds(goal):
+            print("ERR: Invalid coord in query. Coord value must be between 0 and the map size.")
+            quit()
+
+    recorder = ExpansionRecorder(grid) if args.export_expansions else None
+    cache = pathcache.open_cache(args.cache) if args.cache else None
+    mode = pathcache.search_mode(args.cluster_size if args.hierarchical else None, args.bidirectional, args.epsilon, args.any_angle)
+
+    def search(start, goal):
+        # A query that starts or ends on a barrier would otherwise flood everything reachable, which on a
+        # tiled map can be most of a region
+        if grid.is_barrier(start) or grid.is_barrier(goal):
+            stats = SearchStats()
+            stats.end_phase("setup")
+            return SearchResult([], float("inf"), 0, stats.setup_time, stats=stats)
+        # Smoothing is cheap, so cached paths are kept unsmoothed and smoothed again when they're reused
+        if cache:
+            result = cache.search(grid, start, goal, args.heuristic, mode, lambda: run_search(start, goal))
+        else:
+            result = run_search(start, goal)
+        return anyangle.smooth_result(grid, result) if args.smooth else result
+
+    def run_search(start, goal):
+        if args.any_angle:
+            return anyangle.find_path(grid, start, goal, recorder)
+        if args.hierarchical:
+            return hpa.find_path(grid, start, goal, args.heuristic, args.cluster_size, recorder)
+        if args.bidirectional:
+            return find_path_bidirectional(grid, start, goal, args.heuristic, recorder)
+        return find_path(grid, start, goal, args.heuristic, recorder, args.epsilon)
+
+    if args.path:
+        start, goal = queries[0]
+        if args.precheck and not is_reachable(grid, start, goal):
+            print(f"\nEnd node [{goal[0]}, {goal[1]}] is unreachable from start node [{start[0]}, {start[1]}].")
+            quit()
+        result = search(start, goal)
+        print_result(result)
+        if args.print_path:
+            print(format_path(result.path, args.print_path))
+        if args.stats:
+            print_stats(result.stats)
+        if args.audit:
+            print_audit(audit_heuristic(grid, goal, args.heuristic, anyangle.path_cells(result.path)))
+        if recorder:
+            recorder.save(args.export_expansions)
+        if cache:
+            cache.save()
+        if tiled:
+            print_tiles(grid)
+        return
+
+    # Batch mode: one line per query, X1 Y1 X2 Y2 followed by cost, spaces explored and seconds
+    batch_start_time = time.time()
+    for start, goal in queries:
+        if args.precheck and not is_reachable(grid, start, goal):
+            print(f"{start[0]} {start[1]} {goal[0]} {goal[1]} unreachable 0 0.0000")
+            continue
+        result = search(start, goal)
+        print(f"{start[0]} {start[1]} {goal[0]} {goal[1]} {result.cost:.4f} {result.nodes_explored} {result.elapsed:.4f}")
+        if args.print_path:
+            print(f"# path: {format_path(result.path, args.print_path)}")
+        if args.stats and result.stats:
+            print(f"# stats: {json.dumps(result.stats.as_dict())}")
+        if args.audit:
+            audit = audit_heuristic(grid, goal, args.heuristic, anyangle.path_cells(result.path))
+            print(f"# inconsistent edges: {audit['inconsistent_edges']}, inadmissible path nodes: {audit['inadmissible_nodes']}")
+    print(f"# {len(queries)} queries in {time.time() - batch_start_time:.4f} seconds")
+    if cache:
+        print(f"# path cache: {cache.hits} hits, {cache.misses} misses")
+        cache.save()
+    if recorder:
+        recorder.save(args.export_expansions)
+    if tiled:
+        print(f"# tiles: {grid.tile_loads} loaded, {grid.tile_evictions} closed again, at most {grid.peak_open} open at once")
+
+if __name__ == "__main__":
+    main()
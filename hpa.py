@@ -0,0 +1,310 @@
+import argparse
+import heapq
+import os
+import time
+import numpy as np
+import engine
+import terrain
+
+# Hierarchical pathfinding (HPA*). The grid is cut into square clusters, and wherever two neighboring clusters
+# share free border nodes, one or two transitions are placed across the border. Transitions are the nodes of
+# an abstract graph: inter-cluster edges cross a border, and intra-cluster edges hold the exact cost between
+# two transitions of the same cluster, found by searching inside that cluster only (so extra costs are included).
+#
+# A query connects the start and goal to the transitions of their clusters, searches the small abstract graph,
+# then runs A* on the full grid restricted to the clusters the abstract path passes through (the corridor).
+# Paths are usually optimal or very close to it, but that is not guaranteed.
+
+CLUSTER_SIZE = 16
+ENTRANCE_SPLIT = 6 # Border runs at least this long get a transition at each end instead of one in the middle
+
+class Abstraction:
+    def __init__(self, grid, cluster_size, diagonal, nodes, edges, costs):
+        self.grid = grid
+        self.cluster_size = cluster_size
+        self.diagonal = diagonal
+        self.revision = grid.revision
+        self.nodes = nodes # Flat cell index of every transition
+        self.edges = edges # (from, to) cell index pairs
+        self.costs = costs # Cost of each edge
+        self.graph = {int(node): [] for node in nodes}
+        for (a, b), cost in zip(edges.tolist(), costs.tolist()):
+            self.graph[a].append((b, cost))
+        self.cluster_nodes = {}
+        for node in self.graph:
+            self.cluster_nodes.setdefault(self.cluster(node), []).append(node)
+
+    def cluster(self, index):
+        x, y = divmod(index, self.grid.height)
+        return x // self.cluster_size, y // self.cluster_size
+
+    def bounds(self, cluster):
+        return cluster_bounds(self.grid, self.cluster_size, cluster)
+
+def cluster_bounds(grid, cluster_size, cluster):
+    # (x0, y0, x1, y1) of a cluster, end exclusive
+    cx, cy = cluster
+    return cx * cluster_size, cy * cluster_size, min((cx + 1) * cluster_size, grid.width), min((cy + 1) * cluster_size, grid.height)
+
+def border_runs(free_pairs):
+    # (begin, end) of every run of True in a 1D bool array, end exclusive
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], free_pairs, [False])).astype(np.int8)))
+    return zip(edges[::2].tolist(), edges[1::2].tolist())
+
+def find_transitions(grid, cluster_size):
+    # Returns (a, b) cell index pairs, a and b on either side of a cluster border
+    free = grid.costs != grid.barrier
+    height = grid.height
+    pairs = []
+    for x in range(cluster_size - 1, grid.width - 1, cluster_size):
+        # Vertical border between x and x + 1
+        for y0 in range(0, height, cluster_size):
+            y1 = min(y0 + cluster_size, height)
+            for begin, end in border_runs(free[x, y0:y1] & free[x + 1, y0:y1]):
+                ys = [begin, end - 1] if end - begin >= ENTRANCE_SPLIT else [(begin + end - 1) // 2]
+                pairs += [(x * height + y0 + y, (x + 1) * height + y0 + y) for y in ys]
+    for y in range(cluster_size - 1, height - 1, cluster_size):
+        # Horizontal border between y and y + 1
+        for x0 in range(0, grid.width, cluster_size):
+            x1 = min(x0 + cluster_size, grid.width)
+            for begin, end in border_runs(free[x0:x1, y] & free[x0:x1, y + 1]):
+                xs = [begin, end - 1] if end - begin >= ENTRANCE_SPLIT else [(begin + end - 1) // 2]
+                pairs += [((x0 + x) * height + y, (x0 + x) * height + y + 1) for x in xs]
+    return pairs
+
+def cluster_grid(grid, bounds):
+    x0, y0, x1, y1 = bounds
+    return terrain.Grid(grid.costs[x0:x1, y0:y1])
+
+def cluster_costs(grid, bounds, source, targets, heuristic):
+    # Costs from source to each of targets (cell indices) moving inside one cluster only
+    if not targets:
+        return []
+    x0, y0, _, _ = bounds
+    sub = cluster_grid(grid, bounds)
+    local = lambda index: (index // grid.height - x0, index % grid.height - y0)
+    costs = engine.dijkstra(sub, local(source), heuristic, [local(target) for target in targets])
+    return [costs[local(target)] for target in targets]
+
+def build_abstraction(grid, cluster_size=CLUSTER_SIZE, heuristic="octile"):
+    diagonal = engine.is_diagonal(heuristic)
+    cells = grid.cells
+    edges = []
+    costs = []
+    cluster_nodes = {}
+    height = grid.height
+
+    def add(node):
+        x, y = divmod(node, height)
+        nodes = cluster_nodes.setdefault((x // cluster_size, y // cluster_size), [])
+        if node not in nodes:
+            nodes.append(node)
+
+    for a, b in find_transitions(grid, cluster_size):
+        add(a)
+        add(b)
+        # Moving onto a node pays its extra cost, so the two directions can differ
+        edges += [(a, b), (b, a)]
+        costs += [1 + cells[b], 1 + cells[a]]
+
+    for (cx, cy), nodes in cluster_nodes.items():
+        bounds = cluster_bounds(grid, cluster_size, (cx, cy))
+        for node in nodes:
+            others = [other for other in nodes if other != node]
+            if not others:
+                continue
+            for other, cost in zip(others, cluster_costs(grid, bounds, node, others, heuristic)):
+                if cost != float("inf"):
+                    edges.append((node, other))
+                    costs.append(cost)
+
+    all_nodes = np.array(sorted(node for nodes in cluster_nodes.values() for node in nodes), dtype=np.int64)
+    return Abstraction(grid, cluster_size, diagonal, all_nodes, np.array(edges, dtype=np.int64).reshape(-1, 2), np.array(costs, dtype=np.float64))
+
+def get_abstraction(grid, heuristic="octile", cluster_size=CLUSTER_SIZE):
+    # Built once per grid and kept on it until the grid is edited. For unedited maps it's also saved next
+    # to the compiled map, one file per cluster size and movement rule.
+    diagonal = engine.is_diagonal(heuristic)
+    cached = grid.abstractions.get((cluster_size, diagonal))
+    if cached and cached.revision == grid.revision:
+        return cached
+
+    kind = f"hpa{cluster_size}{'d' if diagonal else 'c'}.npz"
+    abstraction_path = terrain.derived_path(grid, kind)
+    abstraction = None
+    if abstraction_path and os.path.exists(abstraction_path):
+        with np.load(abstraction_path) as data:
+            abstraction = Abstraction(grid, cluster_size, diagonal, data["nodes"], data["edges"], data["costs"])
+    if abstraction is None:
+        abstraction = build_abstraction(grid, cluster_size, heuristic)
+        if abstraction_path:
+            try:
+                os.makedirs(os.path.dirname(abstraction_path), exist_ok=True)
+                terrain.write_atomic(abstraction_path, lambda f: np.savez(f, nodes=abstraction.nodes, edges=abstraction.edges, costs=abstraction.costs))
+            except OSError:
+                pass
+    grid.abstractions[(cluster_size, diagonal)] = abstraction
+    return abstraction
+
+def abstract_search(abstraction, start, goal, start_edges, goal_edges, h_function, stats):
+    # A* over the transitions. start_edges are (node, cost) from the start, goal_edges are {node: cost to goal}.
+    # Returns (list of cell indices from start to goal, nodes explored), or (None, nodes explored).
+    # Pushes, reopens, peak open list size and heuristic evaluations are added to stats.
+    height = abstraction.grid.height
+    goal_x, goal_y = divmod(goal, height)
+
+    def h(node):
+        x, y = divmod(node, height)
+        return h_function(abs(x - goal_x), abs(y - goal_y))
+
+    g_score = {start: 0}
+    came_from = {}
+    closed = set()
+    open_list = [(h(start), 0, start)]
+    stats.pushes += 1
+    stats.heuristic_evaluations += 1
+    nodes_explored = 0
+    while open_list:
+        stats.peak_open = max(stats.peak_open, len(open_list))
+        _, current_g, current = heapq.heappop(open_list)
+        if current_g > g_score[current]:
+            continue
+        closed.add(current)
+        nodes_explored += 1
+        if current == goal:
+            path = [goal]
+            while path[-1] != start:
+                path.append(came_from[path[-1]])
+            path.reverse()
+            return path, nodes_explored
+
+        edges = abstraction.graph.get(current, [])
+        if current == start:
+            edges = start_edges + edges # The start can also be a transition itself
+        if current in goal_edges:
+            edges = edges + [(goal, goal_edges[current])]
+        for neighbor, cost in edges:
+            temp_g_score = current_g + cost
+            if temp_g_score < g_score.get(neighbor, float("inf")):
+                if neighbor in closed:
+                    closed.discard(neighbor)
+                    stats.reopens += 1
+                g_score[neighbor] = temp_g_score
+                came_from[neighbor] = current
+                stats.pushes += 1
+                stats.heuristic_evaluations += 1
+                heapq.heappush(open_list, (temp_g_score + h(neighbor), temp_g_score, neighbor))
+    return None, nodes_explored
+
+def refine(grid, start, goal, heuristic, abstraction, corridor, stats, visit=None):
+    # A* on the full grid that only steps into the clusters of corridor. Adds to stats like abstract_search, and
+    # ends its search phase.
+    diagonal = abstraction.diagonal
+    h_function = engine.HEURISTICS.get(heuristic, engine.octile)
+    height = grid.height
+    cluster_size = abstraction.cluster_size
+    goal_x, goal_y = divmod(goal, height)
+    workspace = engine.get_workspace(grid)
+    generation = workspace.next_generation()
+    stamp = workspace.stamp
+    g_score = workspace.g_score
+    came_from = workspace.came_from
+    nodes_explored = 0
+
+    open_list = engine.HeapQueue()
+    stamp[start] = generation
+    g_score[start] = 0
+    open_list.push(0, 0, start)
+    stats.pushes += 1
+    closed = generation + 1 # Stamp of expanded nodes, so reopens can be counted
+    while open_list:
+        stats.peak_open = max(stats.peak_open, len(open_list))
+        current_g, current = open_list.pop()
+        if current_g > g_score[current]:
+            continue
+        stamp[current] = closed
+        nodes_explored += 1
+        if current == goal:
+            stats.end_phase("search")
+            return engine.reconstruct_path(grid, came_from, start, goal), current_g, nodes_explored
+
+        for neighbor, move_cost in engine.get_neighbors(grid, current, diagonal):
+            neighbor_x, neighbor_y = divmod(neighbor, height)
+            if (neighbor_x // cluster_size, neighbor_y // cluster_size) not in corridor:
+                continue
+            temp_g_score = current_g + move_cost
+            neighbor_stamp = stamp[neighbor]
+            if neighbor_stamp < generation or temp_g_score < g_score[neighbor]:
+                if neighbor_stamp == closed:
+                    stats.reopens += 1
+                stamp[neighbor] = generation
+                g_score[neighbor] = temp_g_score
+                came_from[neighbor] = current
+                stats.pushes += 1
+                stats.heuristic_evaluations += 1
+                open_list.push(temp_g_score + h_function(abs(neighbor_x - goal_x), abs(neighbor_y - goal_y)), temp_g_score, neighbor)
+                if visit:
+                    visit("open", (neighbor_x, neighbor_y))
+        if visit:
+            visit("closed", grid.pos(current))
+    stats.end_phase("search")
+    return [], float("inf"), nodes_explored
+
+def find_path(grid, start_pos, goal_pos, heuristic, cluster_size=CLUSTER_SIZE, visit=None):
+    # Same contract as engine.find_path. nodes_explored counts both the abstract and the refining search.
+    # The abstraction is built on the first query (or loaded from the map cache) and isn't included in elapsed.
+    abstraction = get_abstraction(grid, heuristic, cluster_size)
+    start_time = time.time()
+    stats = engine.SearchStats() # Setup is connecting the start and goal to the abstraction
+    if grid.components and not grid.components.connected(start_pos, goal_pos):
+        stats.end_phase("setup")
+        return engine.SearchResult([], float("inf"), 0, time.time() - start_time, stats=stats)
+    start = grid.index(start_pos)
+    goal = grid.index(goal_pos)
+    start_cluster = abstraction.cluster(start)
+    goal_cluster = abstraction.cluster(goal)
+
+    # Connect the start and goal to the transitions of their own clusters
+    start_nodes = abstraction.cluster_nodes.get(start_cluster, [])
+    start_costs = cluster_costs(grid, abstraction.bounds(start_cluster), start, start_nodes + [goal] if start_cluster == goal_cluster else start_nodes, heuristic)
+    start_edges = [(node, cost) for node, cost in zip(start_nodes + [goal], start_costs) if cost != float("inf")]
+    goal_edges = {}
+    for node in abstraction.cluster_nodes.get(goal_cluster, []):
+        cost = cluster_costs(grid, abstraction.bounds(goal_cluster), node, [goal], heuristic)[0]
+        if cost != float("inf"):
+            goal_edges[node] = cost
+
+    h_function = engine.HEURISTICS.get(heuristic, engine.octile)
+    stats.end_phase("setup")
+    abstract_path, nodes_explored = abstract_search(abstraction, start, goal, start_edges, goal_edges, h_function, stats)
+    if abstract_path is None:
+        stats.end_phase("search")
+        stats.expansions = nodes_explored
+        return engine.SearchResult([], float("inf"), nodes_explored, time.time() - start_time, stats=stats)
+
+    corridor = {abstraction.cluster(node) for node in abstract_path}
+    path, cost, refine_explored = refine(grid, start, goal, heuristic, abstraction, corridor, stats, visit)
+    if path:
+        stats.end_phase("reconstruction")
+    stats.expansions = nodes_explored + refine_explored
+    return engine.SearchResult(path, cost, nodes_explored + refine_explored, time.time() - start_time, stats=stats)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the hierarchical (HPA*) abstraction of every map ahead of time.")
+    parser.add_argument("--maps", type=str, nargs="*", help="Map images in the maps subdirectory. Every map by default.")
+    parser.add_argument("--heuristic", type=str, choices=engine.CHOICES, default="octile", help="Heuristic whose movement rules the abstraction is built for.")
+    parser.add_argument("--cluster_size", type=int, default=CLUSTER_SIZE, help="Width/height of a cluster.")
+    args = parser.parse_args()
+
+    names = args.maps if args.maps else terrain.map_names(engine.MAPS_DIR)
+    for name in names:
+        map_path = os.path.join(engine.MAPS_DIR, name)
+        if not os.path.exists(map_path):
+            print(f"ERR: Could not find the map image at: {name}")
+            quit()
+        build_start_time = time.time()
+        abstraction = get_abstraction(terrain.load_grid(map_path), args.heuristic, args.cluster_size)
+        print(f"{name}: {len(abstraction.nodes)} transitions, {len(abstraction.edges)} edges in {time.time() - build_start_time:.4f} seconds")
+
+if __name__ == "__main__":
+    main()
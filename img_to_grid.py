@@ -1,91 +1,194 @@
-from PIL import Image
+from PIL import Image, PngImagePlugin
 import argparse
 import os
+import numpy as np
 import colors
+import terrain
 
-# Setup args
-parser = argparse.ArgumentParser()
-parser.add_argument("source_img", type=str, help="Source image name from within the source_images directory.")
-parser.add_argument("size", type=int, help="Desired width / height of the square output image.")
-parser.add_argument("--binary", type=float, help="For conversions with only barriers and free nodes. Thresholds pixel alpha to 255 or 0 based on this ratio, where values above 255 * bw become opaque and below become transparent.")
-parser.add_argument("--fivesplit", type=int, nargs="+", help="For conversions with 4 edge weights and barrier nodes. Use five values from 0-255 to determine the ranges for which between them edge weights are determined.")
-args = parser.parse_args()
+# Converts a source image into a map. Conversions are done on whole arrays at once rather than pixel by pixel,
+# so even maps of several thousand nodes a side convert in well under a second.
+#
+# Sources too large to hold in memory can be given as a grayscale heightmap array (.npy, indexed [y, x]).
+# Those are memory mapped and downscaled a strip of rows at a time, so only one strip is ever in memory.
+#
+# With --slope, the source is read as a heightmap and every node gets a continuous cost from the local slope
+# (and optionally roughness) instead of one of five brightness levels. These maps are saved as 16-bit grayscale
+# images holding fixed point costs, or with --emit_grid as float32 cost arrays.
 
-source_img_stripped = os.path.splitext(args.source_img)[0]
+Image.MAX_IMAGE_PIXELS = None # Large source images are expected, not a decompression bomb
+STRIP_BYTES = 64 << 20 # Approximate size of each strip of rows read from a heightmap array
 
-# Save the new downscaled image
-out_image_path = os.path.join("maps", source_img_stripped + ".out.png")
+# Map color of each cost, the inverse of terrain.COLOR_COSTS
+COST_COLORS = {cost: color for color, cost in terrain.COLOR_COSTS.items()}
 
-# Open the image and check that its square
-source_image_path = os.path.join("source_images", args.source_img)
-image = Image.open(source_image_path).convert("RGB")
-if image.width != image.height:
-    print(f"ERR: Source image is not a square.\nWidth: {image.width}\nHeight: {image.height}")
+def block_edges(length, size):
+    # Start of each of the size blocks a source axis of this length is split into
+    return (np.arange(size) * length) // size
 
-# Scale down the image
-resized_image = image.resize((args.size, args.size))
+def downscale_array(source, size):
+    # Downscales a (possibly memory mapped) 2D array to size x size by averaging the block of source pixels
+    # behind every output pixel. Rows are read in strips of whole blocks of about STRIP_BYTES each.
+    height, width = source.shape
+    row_edges = block_edges(height, size)
+    col_edges = block_edges(width, size)
+    block_width = np.diff(np.append(col_edges, width))
+    blocks_per_strip = max(1, STRIP_BYTES // max(1, (height // size) * width * source.itemsize))
+    out = np.empty((size, size))
+    for first in range(0, size, blocks_per_strip):
+        last = min(first + blocks_per_strip, size)
+        top = row_edges[first]
+        bottom = row_edges[last] if last < size else height
+        strip = np.asarray(source[top:bottom], dtype=np.float64)
+        sums = np.add.reduceat(np.add.reduceat(strip, row_edges[first:last] - top, axis=0), col_edges, axis=1)
+        block_height = np.diff(np.append(row_edges[first:last], bottom))
+        out[first:last] = sums / np.outer(block_height, block_width)
+    return out
 
-# Convert to barrier/free nodes
-if args.binary:
-    if args.binary < 0 or args.binary > 1:
-        print("ERR: bw ratio out of bounds. Please use a value between 0 and 1.")
+def load_heightmap(source_path, size):
+    # Grayscale brightness (0-255, unrounded) of a downscaled .npy heightmap. uint16 arrays use their full
+    # range and float arrays are expected to hold values from 0 to 1.
+    source = np.load(source_path, mmap_mode="r")
+    if source.ndim != 2:
+        print(f"ERR: Source array must be 2D, got shape {source.shape}.")
+        quit()
+    if source.shape[0] != source.shape[1]:
+        print(f"ERR: Source image is not a square.\nWidth: {source.shape[1]}\nHeight: {source.shape[0]}")
+    if size > min(source.shape):
+        print(f"ERR: Heightmaps can only be scaled down, and size {size} is larger than the source.")
         quit()
+    gray = downscale_array(source, size)
+    if source.dtype == np.uint16:
+        gray /= 257
+    elif source.dtype.kind == "f":
+        gray *= 255
+    return gray
+
+def to_gray(brightness):
+    return np.clip(np.rint(brightness), 0, 255).astype(np.uint8)
+
+def load_image(source_path, size):
+    # The downscaled source image as an RGB PIL image
+    image = Image.open(source_path)
+    if image.width != image.height:
+        print(f"ERR: Source image is not a square.\nWidth: {image.width}\nHeight: {image.height}")
+    image.draft("RGB", (size, size)) # Lets JPEG sources decode straight at a reduced scale
+    return image.convert("RGB").resize((size, size))
+
+def load_image_heights(source_path, size):
+    # Brightness (0-255) of the downscaled source image, keeping the full precision of 16-bit grayscale images
+    image = Image.open(source_path)
+    if image.width != image.height:
+        print(f"ERR: Source image is not a square.\nWidth: {image.width}\nHeight: {image.height}")
+    heights = np.asarray(image.convert("F") if image.mode.startswith("I") else image.convert("L").convert("F"), dtype=np.float64)
+    if image.mode.startswith("I"):
+        heights /= 257 # 16-bit images (some are opened as 32-bit "I")
+    return np.asarray(Image.fromarray(heights.astype(np.float32)).resize((size, size)), dtype=np.float64)
+
+def binary_costs(gray, ratio):
+    # Pixels darker than 255 * ratio become barriers, the rest free nodes
+    return np.where(gray < 255 * ratio, terrain.BARRIER, 0).astype(np.uint8)
 
-    # Convert to grayscale for brightness analysis
-    resized_image = resized_image.convert("L")  # Convert to grayscale
-
-    # Get pixel access
-    bw_image = Image.new("RGB", resized_image.size)  # Create a new blank image
-    pixels = bw_image.load()
-    gray_pixels = resized_image.load()
-
-    # Process each pixel
-    for y in range(resized_image.height):
-        for x in range(resized_image.width):
-            brightness = gray_pixels[x, y]  # Get grayscale intensity (0-255)
-            if brightness < 255 * args.binary:
-                pixels[x, y] = colors.BLACK
-            else:
-                pixels[x, y] = colors.WHITE
-    bw_image.save(out_image_path)
-    quit()
-
-if args.fivesplit:
-    if len(args.fivesplit) != 5:
+def fivesplit_costs(gray, split_points):
+    # Each split point a pixel is at or above lowers its cost by one level, from a barrier down to a free node
+    levels = np.array([terrain.BARRIER, 4, 3, 2, 1, 0], dtype=np.uint8)
+    return levels[np.searchsorted(np.sort(split_points), gray, side="right")]
+
+def costs_to_gray16(costs):
+    # 16-bit grayscale map image of continuous costs indexed [y, x], as fixed point: every cost times a scale
+    # that stretches the largest one to 65534, and 65535 for barriers. Returns (image, scale).
+    finite = np.isfinite(costs)
+    largest = float(costs[finite].max()) if finite.any() else 0
+    scale = 65534 / largest if largest > 0 else 1
+    gray = np.rint(np.where(finite, costs, 0) * scale).astype(np.uint16)
+    gray[~finite] = terrain.BARRIERS[np.dtype(np.uint16)]
+    return gray, scale
+
+def save_gray16(costs, out_image_path):
+    # Saves continuous costs as a 16-bit map image, with their scale in a text chunk for terrain.decode_grid
+    gray, scale = costs_to_gray16(costs)
+    info = PngImagePlugin.PngInfo()
+    info.add_text(terrain.COST_SCALE_KEY, repr(scale))
+    Image.fromarray(gray).save(out_image_path, pnginfo=info)
+
+def costs_to_rgb(costs):
+    # Map image of a cost array indexed [y, x]
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    palette[:] = colors.WHITE
+    for cost, color in COST_COLORS.items():
+        palette[cost] = color
+    return palette[costs]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source_img", type=str, help="Source image name from within the source_images directory. A .npy grayscale heightmap array is read in strips, for sources too large for memory.")
+    parser.add_argument("size", type=int, help="Desired width / height of the square output image.")
+    parser.add_argument("--binary", type=float, help="For conversions with only barriers and free nodes. Thresholds pixel alpha to 255 or 0 based on this ratio, where values above 255 * bw become opaque and below become transparent.")
+    parser.add_argument("--fivesplit", type=int, nargs="+", help="For conversions with 4 edge weights and barrier nodes. Use five values from 0-255 to determine the ranges for which between them edge weights are determined.")
+    parser.add_argument("--slope", type=float, help="For conversions with continuous costs. Reads the source as a heightmap and sets each node's cost from its slope; slopes (height change per node) above this value become barriers.")
+    parser.add_argument("--max_cost", type=float, default=4, help="Extra cost of a node at the --slope limit. Flat nodes cost nothing extra, and costs in between rise linearly.")
+    parser.add_argument("--roughness", type=float, default=0, help="Extra cost per unit of height deviation around each node, for --slope.")
+    parser.add_argument("--height_scale", type=float, default=1, help="Height of one brightness level (0-255) in node widths, for --slope.")
+    parser.add_argument("--emit_grid", action="store_true", help="Save the map as a cost array (.out.npy) that loads without decoding, instead of a .out.png image.")
+    args = parser.parse_args()
+
+    if args.size <= 0:
+        print("ERR: size must be a positive number.")
+        quit()
+    if args.binary is not None and (args.binary < 0 or args.binary > 1):
+        print("ERR: bw ratio out of bounds. Please use a value between 0 and 1.")
+        quit()
+    if args.fivesplit and (len(args.fivesplit) != 5 or any(val < 0 or val > 255 for val in args.fivesplit)):
         print("ERR: Using fivesplit requires 5 values between 0-255.")
         quit()
-    for val in args.fivesplit:
-        if val < 0 or val > 255:
-            print("ERR: Using fivesplit requires 5 values between 0-255.")
-            quit()
-    split_points = sorted(args.fivesplit)
-
-    # Convert to grayscale for brightness analysis
-    resized_image = resized_image.convert("L")  # Convert to grayscale
-
-    # Get pixel access
-    bw_image = Image.new("RGB", resized_image.size)  # Create a new blank image
-    pixels = bw_image.load()
-    gray_pixels = resized_image.load()
-
-    # Process each pixel
-    for y in range(resized_image.height):
-        for x in range(resized_image.width):
-            brightness = gray_pixels[x, y]  # Get grayscale intensity (0-255)
-            if brightness < split_points[0]:
-                pixels[x, y] = colors.BLACK
-            elif brightness < split_points[1]:
-                pixels[x, y] = colors.FIVESPLIT_4
-            elif brightness < split_points[2]:
-                pixels[x, y] = colors.FIVESPLIT_3
-            elif brightness < split_points[3]:
-                pixels[x, y] = colors.FIVESPLIT_2
-            elif brightness < split_points[4]:
-                pixels[x, y] = colors.FIVESPLIT_1
-            else:
-                pixels[x, y] = colors.WHITE
-    bw_image.save(out_image_path)
-    quit()
-    
-# Save the new downscaled image
-resized_image.save(out_image_path)
\ No newline at end of file
+    if args.slope is not None and (args.slope <= 0 or args.max_cost < 0 or args.roughness < 0):
+        print("ERR: --slope must be above 0, and --max_cost and --roughness can't be negative.")
+        quit()
+    if args.slope and (args.binary or args.fivesplit):
+        print("ERR: --slope can't be combined with --binary or --fivesplit.")
+        quit()
+    if args.emit_grid and not (args.binary or args.fivesplit or args.slope):
+        print("ERR: --emit_grid needs a --binary, --fivesplit or --slope conversion.")
+        quit()
+
+    source_img_stripped = os.path.splitext(args.source_img)[0]
+    source_image_path = os.path.join("source_images", args.source_img)
+    out_image_path = os.path.join("maps", source_img_stripped + ".out.png")
+
+    if args.slope:
+        # Continuous costs from the heightmap's slope
+        if terrain.is_grid_file(source_image_path):
+            heights = load_heightmap(source_image_path, args.size)
+        else:
+            heights = load_image_heights(source_image_path, args.size)
+        costs = terrain.slope_costs(heights.T * args.height_scale, args.slope, args.max_cost, args.roughness).T
+        if args.emit_grid:
+            terrain.save_grid_file(os.path.join("maps", source_img_stripped + ".out.npy"), costs.T)
+        else:
+            save_gray16(costs, out_image_path)
+        return
+
+    # Grayscale brightness of the scaled down source, indexed [y, x]
+    if terrain.is_grid_file(source_image_path):
+        gray = to_gray(load_heightmap(source_image_path, args.size))
+        resized_image = Image.fromarray(gray)
+    else:
+        resized_image = load_image(source_image_path, args.size)
+        gray = np.asarray(resized_image.convert("L"))
+
+    # Convert to barrier/free nodes, or to four weights and barriers
+    if args.binary:
+        costs = binary_costs(gray, args.binary)
+    elif args.fivesplit:
+        costs = fivesplit_costs(gray, args.fivesplit)
+    else:
+        # Save the new downscaled image
+        resized_image.save(out_image_path)
+        return
+
+    if args.emit_grid:
+        terrain.save_grid_file(os.path.join("maps", source_img_stripped + ".out.npy"), costs.T)
+    else:
+        Image.fromarray(costs_to_rgb(costs)).save(out_image_path)
+
+if __name__ == "__main__":
+    main()
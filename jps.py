@@ -0,0 +1,238 @@
+import time
+import weakref
+import numpy as np
+import engine
+
+# Jump Point Search for 8-connected grids where diagonal moves can't cut corners (the same movement
+# rules as octile). Runs of free nodes with no extra cost are crossed in single jumps, which prunes
+# the symmetric paths A* would otherwise expand one node at a time.
+# Weighted nodes break the symmetry JPS relies on, so every node that has an extra cost or borders one
+# is treated as a jump point: jumps stop there and it is expanded like plain A* would, with all neighbors.
+#
+# Jumps walk a copy of the grid with a border of barriers around it, so stepping never needs a bounds check.
+# Nodes in the copy are BLOCKED, FREE or WEIGHTED (has an extra cost or borders one), and are indexed by
+# padded index: (x + 1) * pitch + (y + 1) with pitch = height + 2.
+
+BLOCKED = 0
+FREE = 1
+WEIGHTED = 2
+
+# Per grid: (revision, padded nodes), rebuilt after the grid is edited
+padded_cache = weakref.WeakKeyDictionary()
+
+def padded_nodes(grid):
+    cached = padded_cache.get(grid)
+    if cached and cached[0] == grid.revision:
+        return cached[1]
+    free = grid.costs != grid.barrier
+    weighted = free & (grid.costs != 0)
+    near = weighted.copy()
+    near[1:, :] |= weighted[:-1, :]
+    near[:-1, :] |= weighted[1:, :]
+    near[:, 1:] |= near[:, :-1].copy() # Spreading the x-spread mask along y covers the diagonals too
+    near[:, :-1] |= near[:, 1:].copy()
+    padded = np.zeros((grid.width + 2, grid.height + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = np.where(near & free, WEIGHTED, np.where(free, FREE, BLOCKED))
+    nodes = padded.tobytes()
+    padded_cache[grid] = (grid.revision, nodes)
+    return nodes
+
+def jump_straight(nodes, index, step, side, goal):
+    # Steps from index by step until reaching a jump point, which is returned, or a barrier, which returns None.
+    # side is the step across the jump direction, used to spot forced neighbors.
+    while True:
+        node = nodes[index]
+        if node == BLOCKED:
+            return None
+        if node == WEIGHTED or index == goal:
+            return index
+        if (nodes[index + side] and not nodes[index - step + side]) or (nodes[index - side] and not nodes[index - step - side]):
+            return index # Forced neighbor
+        index += step
+
+def jump_diagonal(nodes, index, step_x, step_y, pitch, goal):
+    while True:
+        node = nodes[index]
+        if node == BLOCKED:
+            return None
+        if node == WEIGHTED or index == goal:
+            return index
+        # A diagonal step is a jump point if a straight jump from it finds one
+        if (jump_straight(nodes, index + step_x, step_x, 1, goal) is not None
+                or jump_straight(nodes, index + step_y, step_y, pitch, goal) is not None):
+            return index
+        if not (nodes[index + step_x] and nodes[index + step_y]):
+            return None # No cutting corners
+        index += step_x + step_y
+
+def jump(nodes, index, dx, dy, pitch, goal):
+    # Jumps from index, the first node in direction (dx, dy)
+    if dx and dy:
+        return jump_diagonal(nodes, index, dx * pitch, dy, pitch, goal)
+    if dx:
+        return jump_straight(nodes, index, dx * pitch, 1, goal)
+    return jump_straight(nodes, index, dy, pitch, goal)
+
+def pruned_directions(nodes, index, dx, dy, pitch):
+    # Directions worth jumping in from index when it was reached moving in direction (dx, dy)
+    step_x = dx * pitch
+    directions = []
+    if dx and dy:
+        free_x = nodes[index + step_x]
+        free_y = nodes[index + dy]
+        if free_y:
+            directions.append((0, dy))
+        if free_x:
+            directions.append((dx, 0))
+        if free_x and free_y:
+            directions.append((dx, dy))
+    elif dx:
+        if nodes[index + step_x]:
+            directions.append((dx, 0))
+            if nodes[index - 1]:
+                directions.append((dx, -1))
+            if nodes[index + 1]:
+                directions.append((dx, 1))
+        if nodes[index - 1]:
+            directions.append((0, -1))
+        if nodes[index + 1]:
+            directions.append((0, 1))
+    else:
+        if nodes[index + dy]:
+            directions.append((0, dy))
+            if nodes[index - pitch]:
+                directions.append((-1, dy))
+            if nodes[index + pitch]:
+                directions.append((1, dy))
+        if nodes[index - pitch]:
+            directions.append((-1, 0))
+        if nodes[index + pitch]:
+            directions.append((1, 0))
+    return directions
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+def expand_path(jump_points):
+    # Fills in the straight and diagonal runs between consecutive jump points
+    path = [jump_points[0]]
+    for (x1, y1), (x2, y2) in zip(jump_points, jump_points[1:]):
+        dx, dy = sign(x2 - x1), sign(y2 - y1)
+        x, y = x1, y1
+        while (x, y) != (x2, y2):
+            x += dx
+            y += dy
+            path.append((x, y))
+    return path
+
+def find_path(grid, start_pos, goal_pos, visit=None):
+    # Same contract as engine.find_path. nodes_explored counts expanded jump points.
+    start_time = time.time()
+    stats = engine.SearchStats()
+    if grid.components and not grid.components.connected(start_pos, goal_pos):
+        stats.end_phase("setup")
+        return engine.SearchResult([], float("inf"), 0, time.time() - start_time, stats=stats)
+    height = grid.height
+    pitch = height + 2
+    cells = grid.cells
+    nodes = padded_nodes(grid)
+    start = grid.index(start_pos)
+    goal = grid.index(goal_pos)
+    goal_x, goal_y = goal_pos
+    padded_goal = (goal_x + 1) * pitch + goal_y + 1
+    workspace = engine.get_workspace(grid)
+    generation = workspace.next_generation()
+    stamp = workspace.stamp
+    g_score = workspace.g_score
+    h_score = workspace.h_score
+    came_from = workspace.came_from
+    nodes_explored = 0
+
+    open_list = engine.HeapQueue()
+    stamp[start] = generation
+    g_score[start] = 0
+    h_score[start] = engine.octile(abs(start_pos[0] - goal_x), abs(start_pos[1] - goal_y))
+    came_from[start] = start
+    open_list.push(h_score[start], 0, start)
+    stats.end_phase("setup")
+
+    closed = generation + 1 # Stamp of expanded nodes, so reopens can be counted
+    heuristic_evaluations = 1
+    pushes = 1
+    reopens = 0
+    peak_open = 0
+    path = []
+    cost = float("inf")
+    while open_list:
+        if len(open_list) > peak_open:
+            peak_open = len(open_list)
+        current_g, current = open_list.pop()
+        if current_g > g_score[current]:
+            continue
+        stamp[current] = closed
+        nodes_explored += 1
+
+        if current == goal:
+            stats.end_phase("search")
+            path = expand_path(engine.reconstruct_path(grid, came_from, start, goal))
+            cost = current_g
+            break
+
+        x, y = divmod(current, height)
+        padded = (x + 1) * pitch + y + 1
+        if current == start or nodes[padded] == WEIGHTED:
+            # Expanded like plain A*. Neighbors that are jump points themselves are relaxed directly.
+            successors = []
+            for neighbor, move_cost in engine.get_neighbors(grid, current, True):
+                neighbor_x, neighbor_y = divmod(neighbor, height)
+                padded_neighbor = padded + (neighbor_x - x) * pitch + neighbor_y - y
+                if nodes[padded_neighbor] == WEIGHTED or neighbor == goal:
+                    successors.append((padded_neighbor, move_cost))
+                else:
+                    successors.append((jump(nodes, padded_neighbor, neighbor_x - x, neighbor_y - y, pitch, padded_goal), None))
+        else:
+            parent_x, parent_y = divmod(came_from[current], height)
+            successors = [(jump(nodes, padded + dx * pitch + dy, dx, dy, pitch, padded_goal), None)
+                for dx, dy in pruned_directions(nodes, padded, sign(x - parent_x), sign(y - parent_y), pitch)]
+
+        for padded_neighbor, move_cost in successors:
+            if padded_neighbor is None:
+                continue
+            neighbor_x, neighbor_y = divmod(padded_neighbor, pitch)
+            neighbor_x -= 1
+            neighbor_y -= 1
+            neighbor = neighbor_x * height + neighbor_y
+            if move_cost is None:
+                # Every node jumped over has no extra cost, so only the jump point's own cost is added
+                move_cost = engine.octile(abs(neighbor_x - x), abs(neighbor_y - y)) + cells[neighbor]
+            temp_g_score = current_g + move_cost
+            neighbor_stamp = stamp[neighbor]
+            if neighbor_stamp < generation:
+                stamp[neighbor] = generation
+                heuristic_evaluations += 1
+                h_neighbor = h_score[neighbor] = engine.octile(abs(neighbor_x - goal_x), abs(neighbor_y - goal_y))
+            elif temp_g_score < g_score[neighbor]:
+                if neighbor_stamp == closed:
+                    stamp[neighbor] = generation
+                    reopens += 1
+                h_neighbor = h_score[neighbor]
+            else:
+                continue
+
+            came_from[neighbor] = current
+            g_score[neighbor] = temp_g_score
+            pushes += 1
+            open_list.push(temp_g_score + h_neighbor, temp_g_score, neighbor)
+            if visit:
+                visit("open", (neighbor_x, neighbor_y))
+
+        if visit:
+            visit("closed", (x, y))
+
+    stats.end_phase("reconstruction" if path else "search")
+    stats.expansions = nodes_explored
+    stats.pushes = pushes
+    stats.reopens = reopens
+    stats.peak_open = peak_open
+    stats.heuristic_evaluations = heuristic_evaluations
+    return engine.SearchResult(path, cost, nodes_explored, time.time() - start_time, stats=stats)
@@ -0,0 +1,147 @@
+import argparse
+import os
+import time
+import numpy as np
+import engine
+import terrain
+import components
+
+# ALT heuristic (A*, Landmarks, Triangle inequality). A few landmark nodes are picked per map, and the exact
+# cost from every node to each landmark and back is found once with full Dijkstra sweeps. For any landmark L,
+# the triangle inequality gives two lower bounds on the cost from node v to goal t:
+#     cost(L, t) - cost(L, v)    and    cost(v, L) - cost(t, L)
+# Unlike the geometric heuristics these include extra costs, so on weighted terrain far fewer nodes are explored.
+# The heuristic is the largest bound over all landmarks (and octile), which stays admissible and consistent.
+# Moves like octile.
+#
+# Tables are stored as float32 to halve their size. Every bound is lowered by the most float32 rounding can
+# have added to it (slack), so the heuristic never overestimates.
+
+LANDMARK_COUNT = 8
+
+class LandmarkTables:
+    def __init__(self, grid, count, landmarks, forward, reverse):
+        self.revision = grid.revision
+        self.count = count # Landmarks asked for; fewer are picked on maps with fewer free nodes
+        self.landmarks = landmarks # Flat cell index of every landmark
+        self.forward = forward # forward[i, v]: cost from landmark i to v (inf if unreachable)
+        self.reverse = reverse # reverse[i, v]: cost from v to landmark i
+        finite = [table[np.isfinite(table)] for table in (forward, reverse)]
+        largest = max([float(values.max()) for values in finite if values.size], default=0)
+        self.slack = 2 * largest * float(np.finfo(np.float32).eps) # Largest rounding error of a bound
+        self.forward_rows = [memoryview(row) for row in forward]
+        self.reverse_rows = [memoryview(row) for row in reverse]
+
+def sweep(grid, source, reverse=False):
+    # Cost from source to every node (or from every node to source) as a flat float32 array
+    costs = np.full(len(grid), np.inf, dtype=np.float32)
+    for (x, y), cost in engine.dijkstra(grid, grid.pos(source), "octile", reverse=reverse).items():
+        costs[x * grid.height + y] = cost
+    return costs
+
+def build_tables(grid, count=LANDMARK_COUNT):
+    # Landmarks are picked by farthest point selection in the largest component: the first is the node farthest
+    # from a node near its middle, each next one the node farthest from all landmarks picked so far
+    index = components.get_components(grid)
+    if not index.sizes:
+        empty = np.zeros((0, len(grid)), dtype=np.float32)
+        return LandmarkTables(grid, count, np.zeros(0, dtype=np.int64), empty, empty.copy())
+    largest = max(index.sizes, key=index.sizes.get)
+    members = np.flatnonzero(index.flat == largest)
+    xs, ys = np.divmod(members, grid.height)
+    seed = int(members[np.argmin((xs - xs.mean()) ** 2 + (ys - ys.mean()) ** 2)])
+
+    nearest = sweep(grid, seed)
+    landmarks = []
+    forward = []
+    reverse = []
+    for _ in range(min(count, len(members))):
+        reachable = np.where(np.isfinite(nearest), nearest, -1)
+        landmark = int(np.argmax(reachable))
+        if landmark in landmarks:
+            break
+        landmarks.append(landmark)
+        forward.append(sweep(grid, landmark))
+        reverse.append(sweep(grid, landmark, reverse=True))
+        nearest = forward[0] if len(landmarks) == 1 else np.minimum(nearest, forward[-1])
+    return LandmarkTables(grid, count, np.array(landmarks, dtype=np.int64), np.array(forward), np.array(reverse))
+
+def get_tables(grid, count=LANDMARK_COUNT):
+    # Built once per grid and kept on it until the grid is edited. For unedited maps the tables are also
+    # saved next to the compiled map, so the sweeps only run the first time a map is used.
+    if grid.landmarks and grid.landmarks.revision == grid.revision and grid.landmarks.count == count:
+        return grid.landmarks
+    tables_path = terrain.derived_path(grid, f"alt{count}.npz")
+    tables = None
+    if tables_path and os.path.exists(tables_path):
+        with np.load(tables_path) as data:
+            tables = LandmarkTables(grid, count, data["landmarks"], data["forward"].astype(np.float32, copy=False),
+                data["reverse"].astype(np.float32, copy=False))
+    if tables is None:
+        tables = build_tables(grid, count)
+        if tables_path:
+            try:
+                os.makedirs(os.path.dirname(tables_path), exist_ok=True)
+                terrain.write_atomic(tables_path, lambda f: np.savez(f, landmarks=tables.landmarks, forward=tables.forward, reverse=tables.reverse))
+            except OSError:
+                pass
+    grid.landmarks = tables
+    return tables
+
+def make_heuristic(grid, goal_pos):
+    # Returns h(index) for searches towards goal_pos
+    tables = get_tables(grid)
+    goal = grid.index(goal_pos)
+    goal_x, goal_y = goal_pos
+    height = grid.height
+    octile = engine.octile
+    bounds = []
+    for forward, reverse in zip(tables.forward_rows, tables.reverse_rows):
+        if forward[goal] != np.inf and reverse[goal] != np.inf: # Landmarks in other components can't bound anything
+            bounds.append((forward, forward[goal] - tables.slack, reverse, reverse[goal] + tables.slack))
+
+    def h(index):
+        x, y = divmod(index, height)
+        best = octile(abs(x - goal_x), abs(y - goal_y))
+        for forward, forward_goal, reverse, reverse_goal in bounds:
+            bound = forward_goal - forward[index]
+            if bound > best:
+                best = bound
+            bound = reverse[index] - reverse_goal
+            if bound > best:
+                best = bound
+        return best
+    return h
+
+def heuristic_array(grid, goal_pos):
+    # The same heuristic for every node at once, as a float array indexed [x, y]
+    tables = get_tables(grid)
+    goal = grid.index(goal_pos)
+    h = engine.heuristic_array(grid, goal_pos, "octile")
+    for forward, reverse in zip(tables.forward, tables.reverse):
+        if not (np.isfinite(forward[goal]) and np.isfinite(reverse[goal])):
+            continue
+        with np.errstate(invalid="ignore"):
+            bounds = np.maximum(forward[goal] - forward, reverse - reverse[goal]).reshape(h.shape) - tables.slack
+        reachable = np.isfinite(forward).reshape(h.shape) # Nodes outside the goal's component keep octile
+        h = np.where(reachable, np.maximum(h, bounds), h)
+    return h
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the ALT landmark tables of every map ahead of time.")
+    parser.add_argument("--maps", type=str, nargs="*", help="Map images in the maps subdirectory. Every map by default.")
+    parser.add_argument("--landmarks", type=int, default=LANDMARK_COUNT, help="Number of landmarks per map.")
+    args = parser.parse_args()
+
+    names = args.maps if args.maps else terrain.map_names(engine.MAPS_DIR)
+    for name in names:
+        map_path = os.path.join(engine.MAPS_DIR, name)
+        if not os.path.exists(map_path):
+            print(f"ERR: Could not find the map image at: {name}")
+            quit()
+        build_start_time = time.time()
+        tables = get_tables(terrain.load_grid(map_path), args.landmarks)
+        print(f"{name}: {len(tables.landmarks)} landmarks in {time.time() - build_start_time:.4f} seconds")
+
+if __name__ == "__main__":
+    main()
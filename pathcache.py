@@ -0,0 +1,148 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import weakref
+from collections import OrderedDict
+import engine
+import terrain
+
+# Cache of search results for queries that are asked again on an unchanged map. Entries are keyed by
+# (map content, start, goal, heuristic, search mode), so an edit to the grid changes the key and old results
+# are never returned for the edited map. They simply age out of the cache. The least recently used entry is
+# evicted once the cache is full, and the cache is kept on disk between runs.
+
+CACHE_SIZE = 1024 # Entries kept by default
+CACHE_FILE = os.path.join("maps", terrain.CACHE_DIR, "paths.json") # Next to the compiled maps
+
+# Per grid: (revision, content key), recomputed after the grid is edited
+content_keys = weakref.WeakKeyDictionary()
+
+def content_key(grid):
+    # Unedited maps are identified by the hash of their map file and the cache version it was decoded with;
+    # anything else by a hash of its cost array
+    if grid.source_hash and not grid.revision:
+        return f"map:{terrain.CACHE_VERSION}:{grid.source_hash}"
+    cached = content_keys.get(grid)
+    if cached and cached[0] == grid.revision:
+        return cached[1]
+    if grid.costs is None:
+        # Tiled maps (tiles.py): the map as loaded, plus the content of every tile edited since
+        sha = hashlib.sha256(grid.source_hash.encode())
+        for (tx, ty), cells in sorted(grid.edited.items()):
+            sha.update(f" {tx} {ty} ".encode())
+            sha.update(cells.cast("B"))
+        key = "tiles:" + sha.hexdigest()
+        content_keys[grid] = (grid.revision, key)
+        return key
+    sha = hashlib.sha256(f"{grid.costs.dtype.str} {grid.width} {grid.height} ".encode())
+    sha.update(memoryview(grid.costs.reshape(-1)).cast("B"))
+    key = "grid:" + sha.hexdigest()
+    content_keys[grid] = (grid.revision, key)
+    return key
+
+def search_mode(cluster_size=None, bidirectional=False, epsilon=0, any_angle=False):
+    # Name of a search mode and its parameters, as used in cache keys. Modes that can return different paths
+    # for the same query must have different names.
+    if any_angle:
+        return "thetastar"
+    if cluster_size:
+        return f"hpa{cluster_size}"
+    if bidirectional:
+        return "bidirectional"
+    if epsilon:
+        return f"weighted{epsilon:g}"
+    return "astar"
+
+class PathCache:
+    def __init__(self, size=CACHE_SIZE, cache_path=CACHE_FILE):
+        self.size = size
+        self.cache_path = cache_path
+        self.entries = OrderedDict() # key: (path, cost, nodes explored, bound), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, grid, start_pos, goal_pos, heuristic, mode):
+        return (content_key(grid), *start_pos, *goal_pos, heuristic, mode)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, result):
+        self.entries[key] = (result.path, result.cost, result.nodes_explored, result.bound)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def search(self, grid, start_pos, goal_pos, heuristic, mode, search):
+        # Returns the cached result of the query, or runs search() and caches its result.
+        # Cached results report the nodes explored by the search that found them, but their stats only cover the
+        # lookup (its time as setup), since nothing was searched.
+        start_time = time.time()
+        stats = engine.SearchStats()
+        key = self.key(grid, start_pos, goal_pos, heuristic, mode)
+        entry = self.get(key)
+        if entry is None:
+            result = search()
+            self.put(key, result)
+            return result
+        path, cost, nodes_explored, bound = entry
+        stats.end_phase("setup")
+        return engine.SearchResult(list(path), cost, nodes_explored, time.time() - start_time, bound, stats, True)
+
+    def load(self):
+        # Missing or unreadable cache files just start an empty cache
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, path, cost, nodes_explored, bound in data.get("entries", []):
+            self.entries[tuple(key)] = ([tuple(pos) for pos in path], float("inf") if cost is None else cost, nodes_explored, bound)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        # Costs of unreachable queries are stored as null, since JSON has no infinity
+        entries = [[list(key), path, cost if cost != float("inf") else None, nodes_explored, bound]
+            for key, (path, cost, nodes_explored, bound) in self.entries.items()]
+        data = json.dumps({"entries": entries})
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            terrain.write_atomic(self.cache_path, lambda f: f.write(data.encode()))
+        except OSError:
+            pass
+
+def open_cache(size=CACHE_SIZE, cache_path=CACHE_FILE):
+    # A cache of the given size, filled with the entries saved by earlier runs
+    cache = PathCache(size, cache_path)
+    cache.load()
+    return cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or clear the path cache kept between runs.")
+    parser.add_argument("--clear", action="store_true", help="Remove every cached path.")
+    args = parser.parse_args()
+
+    if args.clear:
+        if os.path.exists(CACHE_FILE):
+            os.remove(CACHE_FILE)
+        print("Path cache cleared.")
+        return
+    cache = open_cache(size=float("inf"))
+    maps = {}
+    for key in cache.entries:
+        maps[key[0]] = maps.get(key[0], 0) + 1
+    print(f"{len(cache.entries)} cached paths for {len(maps)} map versions in {CACHE_FILE}")
+    for content, count in sorted(maps.items(), key=lambda item: -item[1]):
+        print(f"{content[:28]}: {count}")
+
+if __name__ == "__main__":
+    main()
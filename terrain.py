@@ -0,0 +1,350 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+import colors
+from PIL import Image
+
+BARRIER = 255 # Cost value marking a barrier node in uint8 grids
+CACHE_DIR = ".cache" # Compiled maps are kept in this subdirectory next to their source image
+CACHE_VERSION = 2 # Bump whenever the compiled format or the color to cost mapping changes
+
+COST_SCALE_KEY = "cost_scale" # PNG text chunk of 16-bit maps holding fixed point costs (see decode_grid)
+
+# Extra traversal cost of each map color. Any color not listed is a free node.
+COLOR_COSTS = {
+    colors.BLACK: BARRIER,
+    colors.FIVESPLIT_4: 4,
+    colors.FIVESPLIT_3: 3,
+    colors.FIVESPLIT_2: 2,
+    colors.FIVESPLIT_1: 1,
+}
+
+# Barrier value of each supported cost array type. uint8 grids hold the five levels of image maps, uint16
+# and float32 grids hold finer or continuous costs, such as the slope costs computed from heightmaps.
+BARRIERS = {
+    np.dtype(np.uint8): BARRIER,
+    np.dtype(np.uint16): 65535,
+    np.dtype(np.float32): np.inf,
+}
+
+def cost_dtype(dtype, costs=None):
+    # Cost arrays of any other type are stored as float32 if they hold floats. Integer costs are stored as uint8 if
+    # they fit (255 being a barrier), uint16 otherwise (65535 being a barrier), which needs the costs themselves.
+    # Raises ValueError for integer costs that don't fit in uint16, or that can't be checked without costs.
+    dtype = np.dtype(dtype)
+    if dtype in BARRIERS:
+        return dtype
+    if dtype.kind == "f":
+        return np.dtype(np.float32)
+    if dtype.kind not in "uib":
+        raise ValueError(f"Unsupported cost type {dtype}")
+    if dtype.kind == "b":
+        return np.dtype(np.uint8)
+    if costs is None:
+        raise ValueError(f"Unsupported cost type {dtype}, costs must be uint8, uint16 or float32")
+    largest = int(costs.max()) if costs.size else 0
+    if largest <= BARRIER:
+        return np.dtype(np.uint8)
+    if largest <= BARRIERS[np.dtype(np.uint16)]:
+        return np.dtype(np.uint16)
+    raise ValueError(f"Costs up to {largest} don't fit in uint16, store them as float32 instead")
+
+# Pathfinding grid backed by a single cost array instead of per-node objects.
+# costs is indexed as costs[x, y] and holds the extra cost of entering each node (never negative), or the
+# barrier value of its type (see BARRIERS).
+# Nodes are also addressed by a flat id, x * height + y, through the cells memoryview,
+# which is what the search engine reads from.
+class Grid:
+    def __init__(self, costs):
+        costs = np.asarray(costs)
+        if costs.dtype.kind in "if" and costs.size and costs.min() < 0:
+            raise ValueError("Costs can't be negative")
+        self.costs = np.ascontiguousarray(costs, dtype=cost_dtype(costs.dtype, costs))
+        self.width, self.height = self.costs.shape
+        self.dtype = self.costs.dtype
+        self.barrier = BARRIERS[self.costs.dtype]
+        self.cells = memoryview(self.costs.reshape(-1))
+        self.workspace = None # Reusable search state, created by the engine on first use
+        self.backward_workspace = None # Second one for searches that also run backwards from the goal
+        self.components = None # Connected component index, kept up to date through set_cell once attached
+        self.abstractions = {} # HPA* abstractions by (cluster size, diagonal), rebuilt once the grid is edited
+        self.landmarks = None # ALT landmark tables, rebuilt once the grid is edited
+        self.watchers = [] # Called as watcher(index, old cost, new cost) after every edit
+        self.source_path = None # Map image this grid was loaded from, if any
+        self.source_hash = None # SHA-256 of that map image
+        self.revision = 0 # Number of edits since the grid was created or loaded
+
+    def __len__(self):
+        return self.width * self.height
+
+    def index(self, pos):
+        return pos[0] * self.height + pos[1]
+
+    def pos(self, index):
+        return divmod(index, self.height)
+
+    def in_bounds(self, pos):
+        return 0 <= pos[0] < self.width and 0 <= pos[1] < self.height
+
+    def is_barrier(self, pos):
+        return self.cells[self.index(pos)] == self.barrier
+
+    def extra_cost(self, pos):
+        return self.cells[self.index(pos)]
+
+    def set_cell(self, index, cost):
+        # Every edit goes through here so anything derived from the grid can follow along
+        old_cost = self.cells[index]
+        if old_cost == cost:
+            return
+        self.cells[index] = cost
+        self.revision += 1
+        if self.components:
+            self.components.update(index, old_cost, cost)
+        for watcher in self.watchers:
+            watcher(index, old_cost, cost)
+
+    def set_barrier(self, pos):
+        self.set_cell(self.index(pos), self.barrier)
+
+    def set_cost(self, pos, extra_cost):
+        self.set_cell(self.index(pos), extra_cost)
+
+    def reset(self, pos):
+        self.set_cell(self.index(pos), 0)
+
+    def copy(self):
+        grid = Grid(self.costs.copy())
+        grid.source_path = self.source_path
+        grid.source_hash = self.source_hash
+        grid.revision = self.revision
+        if self.components:
+            grid.components = self.components.copy(grid)
+        return grid
+
+def make_grid(width, height=None, dtype=np.uint8):
+    return Grid(np.zeros((width, height or width), dtype=dtype))
+
+def pack_rgb(rgb):
+    rgb = rgb.astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+def costs_from_rgb(rgb):
+    # rgb is an image array indexed [y, x, channel]; the result is indexed [x, y]
+    packed = pack_rgb(rgb)
+    costs = np.zeros(packed.shape, dtype=np.uint8)
+    for color, cost in COLOR_COSTS.items():
+        costs[packed == pack_rgb(np.array(color))] = cost
+    return costs.T
+
+def is_grid_file(map_path):
+    # Maps can also be stored directly as a cost array (.npy, indexed [x, y]) instead of an image
+    return map_path.endswith(".npy")
+
+def map_names(maps_dir):
+    # Every map in maps_dir: converted images (*.out.png) and cost arrays (*.out.npy)
+    return sorted(os.path.basename(path) for pattern in ("*.out.png", "*.out.npy") for path in glob.glob(os.path.join(maps_dir, pattern)))
+
+def slope_costs(heights, max_slope, max_cost, roughness=0):
+    # Continuous costs of a heightmap indexed [x, y], in elevation units per node. The extra cost rises linearly
+    # with the slope, from 0 on flat ground to max_cost at max_slope, and anything steeper is a barrier.
+    # roughness adds that much cost per unit of height deviation within each node's 3x3 neighborhood.
+    heights = np.asarray(heights, dtype=np.float64)
+    grad_x, grad_y = np.gradient(heights) if min(heights.shape) > 1 else (np.zeros(heights.shape),) * 2
+    slope = np.hypot(grad_x, grad_y)
+    costs = max_cost * slope / max_slope
+    if roughness:
+        padded = np.pad(heights, 1, mode="edge")
+        windows = [padded[dx:dx + heights.shape[0], dy:dy + heights.shape[1]] for dx in range(3) for dy in range(3)]
+        mean = sum(windows) / 9
+        variance = sum(window * window for window in windows) / 9 - mean * mean
+        costs += roughness * np.sqrt(np.maximum(variance, 0))
+    costs[slope > max_slope] = np.inf
+    return costs.astype(np.float32)
+
+def decode_grid(map_path):
+    if is_grid_file(map_path):
+        return Grid(np.load(map_path))
+    with Image.open(map_path) as map_img:
+        if map_img.mode.startswith("I;16"):
+            # 16-bit grayscale maps hold the extra cost of every node as fixed point, cost times the scale in
+            # their cost_scale text chunk, with 65535 for barriers. Without the chunk, costs are whole numbers.
+            gray = np.asarray(map_img, dtype=np.uint16).T
+            scale = float(map_img.info.get(COST_SCALE_KEY, 1))
+            if scale == 1:
+                return Grid(gray)
+            costs = (gray / scale).astype(np.float32)
+            costs[gray == BARRIERS[np.dtype(np.uint16)]] = np.inf
+            return Grid(costs)
+        rgb = np.asarray(map_img.convert("RGB"))
+    return Grid(costs_from_rgb(rgb))
+
+def save_grid_file(map_path, costs):
+    # Writes a cost array indexed [x, y] as a .npy map
+    write_atomic(map_path, lambda f: np.save(f, np.ascontiguousarray(costs)))
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def cache_paths(map_path):
+    # Compiled cost array (.npy) and its metadata (.json)
+    cache_dir = os.path.join(os.path.dirname(map_path), CACHE_DIR)
+    name = os.path.basename(map_path)
+    return os.path.join(cache_dir, name + ".npy"), os.path.join(cache_dir, name + ".json")
+
+def derived_stamp(source_hash):
+    # Part of a derived cache file's name identifying the map it was computed from: the source hash, plus
+    # CACHE_VERSION, since the same map file decodes differently once the version changes
+    return f"{source_hash[:16]}-v{CACHE_VERSION}"
+
+def derived_path(grid, kind):
+    # Cache file for data computed from an unedited, loaded map, such as its component labels.
+    # The source hash and cache version are part of the name, so a changed map never picks up stale data.
+    # Returns None if the grid didn't come from a map file or has been edited since.
+    if grid.source_path is None or grid.source_hash is None or grid.revision:
+        return None
+    cache_dir = os.path.join(os.path.dirname(grid.source_path), CACHE_DIR)
+    return os.path.join(cache_dir, f"{os.path.basename(grid.source_path)}.{derived_stamp(grid.source_hash)}.{kind}")
+
+def remove_derived(map_path, source_hash):
+    # Drops derived cache files of older versions of a map
+    cache_dir = os.path.join(os.path.dirname(map_path), CACHE_DIR)
+    prefix = os.path.basename(map_path) + "."
+    for path in glob.glob(os.path.join(glob.escape(cache_dir), glob.escape(prefix) + "*.*.*")):
+        name = os.path.basename(path)[len(prefix):]
+        if not name.startswith(derived_stamp(source_hash) + ".") and not name.endswith(".tmp"):
+            os.remove(path)
+
+def write_atomic(path, write):
+    # Write to a temporary file first so a reader never sees a half written cache file
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+def compile_grid(map_path, source_hash=None):
+    # Decodes the map image once and stores its cost array and metadata in the cache
+    grid = decode_grid(map_path)
+    array_path, meta_path = cache_paths(map_path)
+    os.makedirs(os.path.dirname(array_path), exist_ok=True)
+    stat = os.stat(map_path)
+    meta = {
+        "version": CACHE_VERSION,
+        "source": os.path.basename(map_path),
+        "source_hash": source_hash or file_hash(map_path),
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "width": grid.width,
+        "height": grid.height,
+        "dtype": str(grid.costs.dtype),
+    }
+    write_atomic(array_path, lambda f: np.save(f, grid.costs))
+    write_atomic(meta_path, lambda f: f.write(json.dumps(meta, indent=2).encode()))
+    remove_derived(map_path, meta["source_hash"])
+    grid.source_path = map_path
+    grid.source_hash = meta["source_hash"]
+    return grid
+
+def read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def cached_hash(map_path):
+    # Returns the source hash of a still valid compiled map, or None if it has to be (re)compiled.
+    # An unchanged size and modification time is trusted; otherwise the image is hashed and compared.
+    array_path, meta_path = cache_paths(map_path)
+    meta = read_meta(meta_path)
+    if not meta or meta.get("version") != CACHE_VERSION or not os.path.exists(array_path):
+        return None
+    stat = os.stat(map_path)
+    if meta["source_size"] == stat.st_size and meta["source_mtime_ns"] == stat.st_mtime_ns:
+        return meta["source_hash"]
+    if file_hash(map_path) != meta["source_hash"]:
+        return None
+
+    # Same content, only touched: remember the new modification time so it isn't hashed again
+    meta["source_mtime_ns"] = stat.st_mtime_ns
+    meta["source_size"] = stat.st_size
+    try:
+        write_atomic(meta_path, lambda f: f.write(json.dumps(meta, indent=2).encode()))
+    except OSError:
+        pass
+    return meta["source_hash"]
+
+def load_grid_file(map_path):
+    # .npy maps are already in the compiled format, so they're memory mapped directly. Only their hash is
+    # cached, which names the derived cache files.
+    grid = Grid(np.load(map_path, mmap_mode="c"))
+    grid.source_path = map_path
+    _, meta_path = cache_paths(map_path)
+    meta = read_meta(meta_path)
+    stat = os.stat(map_path)
+    if meta and meta.get("version") == CACHE_VERSION and meta["source_size"] == stat.st_size and meta["source_mtime_ns"] == stat.st_mtime_ns:
+        grid.source_hash = meta["source_hash"]
+        return grid
+    grid.source_hash = file_hash(map_path)
+    meta = {
+        "version": CACHE_VERSION,
+        "source": os.path.basename(map_path),
+        "source_hash": grid.source_hash,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "width": grid.width,
+        "height": grid.height,
+        "dtype": str(grid.costs.dtype),
+    }
+    try:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        write_atomic(meta_path, lambda f: f.write(json.dumps(meta, indent=2).encode()))
+        remove_derived(map_path, grid.source_hash)
+    except OSError:
+        pass
+    return grid
+
+def load_grid(map_path, use_cache=True):
+    # Loads a map from its compiled cache, compiling it first if it is missing or the image changed.
+    # The cached array is memory mapped copy-on-write, so loading doesn't copy it and edits to the grid
+    # never reach the cache file.
+    if not use_cache:
+        return decode_grid(map_path)
+    if is_grid_file(map_path):
+        return load_grid_file(map_path)
+    try:
+        source_hash = cached_hash(map_path)
+        if source_hash is None:
+            return compile_grid(map_path)
+        grid = Grid(np.load(cache_paths(map_path)[0], mmap_mode="c"))
+        grid.source_path = map_path
+        grid.source_hash = source_hash
+        return grid
+    except OSError:
+        return decode_grid(map_path) # Cache directory not writable, so fall back to decoding every time
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile map images into the cached grid format ahead of time.")
+    parser.add_argument("maps", type=str, nargs="*", help="Map images to compile. Defaults to every *.out.png map in the maps subdirectory.")
+    parser.add_argument("--force", action="store_true", help="Recompile even if the cache is up to date.")
+    args = parser.parse_args()
+
+    for map_path in args.maps or sorted(glob.glob(os.path.join("maps", "*.out.png"))):
+        if is_grid_file(map_path):
+            print(f"{map_path}: already a cost array, nothing to compile")
+            continue
+        if not args.force and cached_hash(map_path):
+            print(f"{map_path}: up to date")
+            continue
+        grid = compile_grid(map_path)
+        print(f"{map_path}: compiled {grid.width}x{grid.height} to {cache_paths(map_path)[0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dstar
+import engine
+import terrain
+
+# Replanning after an edit must find the same cost as searching the edited map from scratch, even when the
+# cost of a path depends on the order its moves were summed in.
+
+class ReplanTest(unittest.TestCase):
+    def replan(self, costs, start_pos, goal_pos, barrier_pos):
+        grid = terrain.Grid(np.array(costs, dtype=np.uint8))
+        planner = dstar.DStarLite(grid, start_pos, goal_pos, "octile")
+        planner.plan()
+        grid.set_barrier(barrier_pos)
+        result = planner.plan()
+        expected = engine.find_path(grid, start_pos, goal_pos, "octile")
+        self.assertAlmostEqual(result.cost, expected.cost)
+        self.assertEqual(len(result.path), len(expected.path))
+        return result
+
+    def test_tied_keys(self):
+        # Used to stop early on a tie and return 6.2426 with stale g values
+        costs = np.array([
+            [255, 0, 255, 0, 255],
+            [0, 0, 0, 0, 0],
+            [0, 1, 255, 255, 255],
+            [0, 0, 0, 0, 1],
+            [1, 0, 0, 0, 0],
+            [255, 0, 255, 1, 0],
+        ]).T
+        result = self.replan(costs, (3, 4), (1, 0), (0, 1))
+        self.assertAlmostEqual(result.cost, 5 + 2 ** 0.5)
+
+    def test_path_terminates(self):
+        # Used to never return from plan(), and path() went in circles
+        costs = np.zeros((8, 11))
+        for pos in [(1, 6), (2, 8), (3, 7), (6, 10), (7, 4), (7, 6)]:
+            costs[pos] = 255
+        self.replan(costs, (5, 5), (1, 0), (2, 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+import terrain
+
+# Tiled maps, for terrain too large to load as one grid, such as a regional mosaic. A tiled map is a directory
+# (<name>.tiles in the maps subdirectory) holding tiles.json, with the size of the whole map, the tile size and
+# the cost type, plus one .npy cost array per tile, indexed [x, y] like every other map. Tile (tx, ty) covers x
+# from tx * tile_size and y from ty * tile_size; tiles along the right and bottom edges may be smaller. A missing
+# tile is all barriers, so unsurveyed parts of a mosaic can simply be left out.
+#
+# A TiledGrid is searched like any other grid, but only memory maps the tiles a search actually touches, and
+# closes the least recently used one whenever more than max_tiles are open. Edited tiles are copied into memory
+# and kept there, so no edit is lost when a tile is closed.
+
+TILE_SIZE = 1024 # Default tile width/height when splitting a map
+MAX_TILES = 64 # Default number of tiles kept open at once
+MANIFEST = "tiles.json"
+TILES_VERSION = 1
+
+def is_tiled(map_path):
+    return map_path.rstrip("/\\").endswith(".tiles")
+
+def tile_name(tx, ty):
+    return f"x{tx}_y{ty}.npy"
+
+def tiles_hash(tiles_path):
+    # Identifies the content of a tiled map without reading every tile: the manifest, plus the name, size and
+    # modification time of every tile file
+    sha = hashlib.sha256()
+    with open(os.path.join(tiles_path, MANIFEST), "rb") as f:
+        sha.update(f.read())
+    for entry in sorted(os.scandir(tiles_path), key=lambda entry: entry.name):
+        if entry.name.endswith(".npy"):
+            stat = entry.stat()
+            sha.update(f"{entry.name} {stat.st_size} {stat.st_mtime_ns}\n".encode())
+    return sha.hexdigest()
+
+class TileCells:
+    # Stands in for Grid.cells: cells[index] reads or writes the node with flat id x * height + y through the
+    # tile it lies in. The tile used last is remembered, since consecutive reads are nearly always in the same one.
+    def __init__(self, grid):
+        self.grid = grid
+        self.key = None
+        self.cells = None
+        self.tile_height = 0
+
+    def locate(self, index):
+        # The cells of the node's tile, and the node's position in them
+        grid = self.grid
+        x, y = divmod(index, grid.height)
+        tx, x = divmod(x, grid.tile_size)
+        ty, y = divmod(y, grid.tile_size)
+        if (tx, ty) != self.key:
+            self.key = (tx, ty)
+            self.cells = grid.tile_cells(tx, ty)
+            self.tile_height = min(grid.tile_size, grid.height - ty * grid.tile_size)
+        return self.cells, x * self.tile_height + y
+
+    def __getitem__(self, index):
+        cells, i = self.locate(index)
+        return cells[i]
+
+    def __setitem__(self, index, cost):
+        cells, i = self.locate(index)
+        cells[i] = cost
+
+    def __len__(self):
+        return len(self.grid)
+
+    def forget(self):
+        # Called when the remembered tile's cells are replaced
+        self.key = None
+        self.cells = None
+
+class TiledGrid(terrain.Grid):
+    # Same interface as terrain.Grid for searching and editing, but there is no single cost array (costs is
+    # None), so whatever needs the whole array at once (component labels, HPA*, ALT, JPS) can't use it.
+    # Grid.__init__ isn't called, since it starts from such an array; every attribute it sets is set here.
+    def __init__(self, tiles_path, max_tiles=MAX_TILES):
+        with open(os.path.join(tiles_path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != TILES_VERSION:
+            raise ValueError(f"Unsupported tiled map version in {tiles_path}")
+        self.tiles_path = tiles_path
+        self.width = manifest["width"]
+        self.height = manifest["height"]
+        self.tile_size = manifest["tile_size"]
+        self.dtype = terrain.cost_dtype(manifest["dtype"])
+        self.barrier = terrain.BARRIERS[self.dtype]
+        self.max_tiles = max_tiles
+        self.open_tiles = OrderedDict() # (tx, ty): cells of an open tile, least recently used first
+        self.edited = {} # (tx, ty): cells of an edited tile, held in memory
+        self.tile_loads = 0
+        self.tile_evictions = 0
+        self.peak_open = 0
+        self.costs = None
+        self.cells = TileCells(self)
+        self.workspace = None
+        self.backward_workspace = None
+        self.components = None
+        self.abstractions = {}
+        self.landmarks = None
+        self.watchers = []
+        self.source_path = tiles_path
+        self.source_hash = tiles_hash(tiles_path)
+        self.revision = 0
+
+    def tile_shape(self, tx, ty):
+        return min(self.tile_size, self.width - tx * self.tile_size), min(self.tile_size, self.height - ty * self.tile_size)
+
+    def load_tile(self, tx, ty):
+        # Memory mapped copy-on-write, or all barriers if the tile file is missing
+        shape = self.tile_shape(tx, ty)
+        tile_path = os.path.join(self.tiles_path, tile_name(tx, ty))
+        if not os.path.exists(tile_path):
+            return np.full(shape, self.barrier, dtype=self.dtype)
+        tile = np.load(tile_path, mmap_mode="c")
+        if tile.shape != shape:
+            raise ValueError(f"Tile {tile_path} has shape {tile.shape}, expected {shape}")
+        if tile.dtype != self.dtype or not tile.flags.c_contiguous:
+            tile = np.ascontiguousarray(tile, dtype=self.dtype)
+        return tile
+
+    def tile_cells(self, tx, ty):
+        key = (tx, ty)
+        cells = self.edited.get(key)
+        if cells is not None:
+            return cells
+        cells = self.open_tiles.get(key)
+        if cells is not None:
+            self.open_tiles.move_to_end(key)
+            return cells
+        cells = memoryview(self.load_tile(tx, ty).reshape(-1))
+        self.open_tiles[key] = cells
+        self.tile_loads += 1
+        while len(self.open_tiles) > self.max_tiles:
+            self.open_tiles.popitem(last=False) # Unmapped once nothing refers to it anymore
+            self.tile_evictions += 1
+        self.peak_open = max(self.peak_open, len(self.open_tiles))
+        return cells
+
+    def set_cell(self, index, cost):
+        x, y = divmod(index, self.height)
+        key = (x // self.tile_size, y // self.tile_size)
+        if key not in self.edited and self.cells[index] != cost:
+            self.edited[key] = memoryview(np.array(self.tile_cells(*key)))
+            self.open_tiles.pop(key, None)
+            self.cells.forget()
+        super().set_cell(index, cost)
+
+    def copy(self):
+        grid = TiledGrid(self.tiles_path, self.max_tiles)
+        grid.edited = {key: memoryview(np.array(cells)) for key, cells in self.edited.items()}
+        grid.revision = self.revision
+        return grid
+
+def load_tiled(tiles_path, max_tiles=MAX_TILES):
+    return TiledGrid(tiles_path, max_tiles)
+
+def split_map(grid, tiles_path, tile_size=TILE_SIZE):
+    # Writes a grid out as a tiled map, one tile at a time. Tiles that are all barriers are left out.
+    # Returns the number of tile files written.
+    os.makedirs(tiles_path, exist_ok=True)
+    written = 0
+    for tx in range(-(-grid.width // tile_size)):
+        for ty in range(-(-grid.height // tile_size)):
+            tile = grid.costs[tx * tile_size:(tx + 1) * tile_size, ty * tile_size:(ty + 1) * tile_size]
+            tile_path = os.path.join(tiles_path, tile_name(tx, ty))
+            if (tile == grid.barrier).all():
+                if os.path.exists(tile_path):
+                    os.remove(tile_path)
+                continue
+            terrain.save_grid_file(tile_path, tile)
+            written += 1
+    manifest = {
+        "version": TILES_VERSION,
+        "width": grid.width,
+        "height": grid.height,
+        "tile_size": tile_size,
+        "dtype": str(grid.costs.dtype),
+    }
+    terrain.write_atomic(os.path.join(tiles_path, MANIFEST), lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a map into a tiled map (<name>.tiles) that engine.py searches without loading it whole.")
+    parser.add_argument("map", type=str, help="Map in the maps subdirectory. .npy maps are memory mapped, so they can be larger than memory.")
+    parser.add_argument("--tile_size", type=int, default=TILE_SIZE, help="Width/height of each tile.")
+    args = parser.parse_args()
+
+    if args.tile_size < 1:
+        print("ERR: --tile_size must be at least 1.")
+        quit()
+    map_path = os.path.join("maps", args.map)
+    if not os.path.exists(map_path):
+        print(f"ERR: Could not find the map image at: {args.map}")
+        quit()
+    grid = terrain.load_grid(map_path)
+    tiles_path = os.path.join("maps", os.path.splitext(args.map)[0] + ".tiles")
+    written = split_map(grid, tiles_path, args.tile_size)
+    print(f"{args.map}: {grid.width}x{grid.height} split into {written} tiles of {args.tile_size} in {tiles_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import os
+import time
+import engine
+import terrain
+
+EXACT_LIMIT = 12 # Largest number of points whose visiting order is solved exactly
+
+class TourResult:
+    def __init__(self, order, path, cost, unreachable, elapsed):
+        self.order = order # Points in the order they are visited, starting with the first point
+        self.path = path # Stitched (x, y) path through every point in order
+        self.cost = cost
+        self.unreachable = unreachable # Points that can't be reached from the first point, left out of the tour
+        self.elapsed = elapsed
+
+def cost_matrix(grid, points, heuristic):
+    # matrix[i][j] is the cost of the cheapest path from points[i] to points[j].
+    # One one-to-many Dijkstra sweep per point instead of a separate search per pair.
+    # Not symmetric, since the extra cost of a node is paid on entering it.
+    return [[costs[point] for point in points] for costs in (engine.dijkstra(grid, source, heuristic, points) for source in points)]
+
+def order_cost(matrix, order, return_to_start=False):
+    cost = sum(matrix[order[i]][order[i + 1]] for i in range(len(order) - 1))
+    if return_to_start and len(order) > 1:
+        cost += matrix[order[-1]][order[0]]
+    return cost
+
+def exact_order(matrix, return_to_start=False):
+    # Held-Karp dynamic programming. Point 0 is always first; every other point is visited exactly once.
+    n = len(matrix)
+    if n <= 2:
+        return list(range(n))
+    inf = float("inf")
+    others = n - 1
+    full = (1 << others) - 1
+    best = [[inf] * others for _ in range(full + 1)] # best[mask][j]: cheapest way to visit mask ending at point j + 1
+    parent = [[-1] * others for _ in range(full + 1)]
+    for j in range(others):
+        best[1 << j][j] = matrix[0][j + 1]
+
+    for mask in range(1, full + 1):
+        for j in range(others):
+            cost = best[mask][j]
+            if cost == inf or not mask & (1 << j):
+                continue
+            for k in range(others):
+                if mask & (1 << k):
+                    continue
+                next_mask = mask | (1 << k)
+                next_cost = cost + matrix[j + 1][k + 1]
+                if next_cost < best[next_mask][k]:
+                    best[next_mask][k] = next_cost
+                    parent[next_mask][k] = j
+
+    closing = [matrix[j + 1][0] if return_to_start else 0 for j in range(others)]
+    last = min(range(others), key=lambda j: best[full][j] + closing[j])
+    order = []
+    mask = full
+    while last != -1:
+        order.append(last + 1)
+        mask, last = mask ^ (1 << last), parent[mask][last]
+    order.append(0)
+    order.reverse()
+    return order
+
+def heuristic_order(matrix, return_to_start=False):
+    # Nearest neighbor tour from point 0, then improved with 2-opt moves until none helps
+    n = len(matrix)
+    order = [0]
+    unvisited = set(range(1, n))
+    while unvisited:
+        current = order[-1]
+        closest = min(unvisited, key=lambda j: matrix[current][j])
+        order.append(closest)
+        unvisited.remove(closest)
+
+    best_cost = order_cost(matrix, order, return_to_start)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                candidate_cost = order_cost(matrix, candidate, return_to_start)
+                if candidate_cost < best_cost - 1e-9:
+                    order, best_cost = candidate, candidate_cost
+                    improved = True
+    return order
+
+def solve_order(matrix, return_to_start=False):
+    if len(matrix) <= EXACT_LIMIT:
+        return exact_order(matrix, return_to_start)
+    return heuristic_order(matrix, return_to_start)
+
+def plan_tour(grid, points, heuristic, return_to_start=False):
+    # Visits every point once, starting at points[0], optionally coming back to it at the end
+    start_time = time.time()
+    matrix = cost_matrix(grid, points, heuristic)
+    reachable = [i for i in range(len(points)) if i == 0 or matrix[0][i] < float("inf")]
+    unreachable = [points[i] for i in range(len(points)) if i not in reachable]
+    matrix = [[matrix[i][j] for j in reachable] for i in reachable]
+    points = [points[i] for i in reachable]
+
+    order = solve_order(matrix, return_to_start)
+    stops = [points[i] for i in order]
+    if return_to_start and len(stops) > 1:
+        stops.append(stops[0])
+
+    # Stitch the legs together, dropping the point shared by consecutive legs
+    path = [stops[0]]
+    cost = 0
+    for leg_start, leg_goal in zip(stops, stops[1:]):
+        leg = engine.find_path(grid, leg_start, leg_goal, heuristic)
+        path += leg.path[1:]
+        cost += leg.cost
+    return TourResult([points[i] for i in order], path, cost, unreachable, time.time() - start_time)
+
+def print_tour(tour):
+    for point in tour.unreachable:
+        print(f"Point [{point[0]}, {point[1]}] is unreachable from the first point and was skipped.")
+    print(f"\nTour successfully found.\nExecution time: {tour.elapsed:.4f} seconds\nTotal path cost: {tour.cost:.4f}")
+    print("Visiting order: " + " -> ".join(f"[{x}, {y}]" for x, y in tour.order))
+
+def main():
+    parser = argparse.ArgumentParser(description="Shortest tour through several points of interest. Never opens a window.")
+    parser.add_argument("heuristic", type=str, choices=engine.CHOICES, help="Choose the heuristic function. Also decides whether diagonal moves are allowed.")
+    parser.add_argument("points", type=int, nargs="+", help="Points in the form X1 Y1 X2 Y2 ... The tour starts at the first point.")
+    parser.add_argument("--size", type=int, default=50, help="Grid size. Grid is square, so 'size' value will apply to height AND width of the grid.")
+    parser.add_argument("--use_map", type=str, help="Choose an image to use for a predefined map. Overrides --size.")
+    parser.add_argument("--return_to_start", action="store_true", help="End the tour back at the first point.")
+    args = parser.parse_args()
+
+    if len(args.points) < 4 or len(args.points) % 2:
+        print("ERR: Supply at least two points in the form X1 Y1 X2 Y2 ...")
+        quit()
+
+    if args.use_map:
+        map_path = os.path.join(engine.MAPS_DIR, args.use_map)
+        if not os.path.exists(map_path):
+            print(f"ERR: Could not find the map image at: {args.use_map}")
+            quit()
+        grid = terrain.load_grid(map_path)
+    else:
+        grid = terrain.make_grid(args.size)
+
+    points = list(zip(args.points[::2], args.points[1::2]))
+    for point in points:
+        if not grid.in_bounds(point) or grid.is_barrier(point):
+            print(f"ERR: Invalid point {point}. Points must be on the map and not on a barrier.")
+            quit()
+
+    print_tour(plan_tour(grid, points, args.heuristic, args.return_to_start))
+
+if __name__ == "__main__":
+    main()